@@ -3,37 +3,100 @@
 Route module for the API
 """
 from os import getenv
+import time
 from api.v1.auth.session_auth import SessionAuth
 from api.v1.auth.session_db_auth import SessionDBAuth
 from api.v1.auth.session_exp_auth import SessionExpAuth
+from api.v1.auth.session_token_auth import SessionTokenAuth
 from api.v1.views import app_views
 from flask import Flask, jsonify, abort, request
 from flask_cors import (CORS, cross_origin)
 import os
 from api.v1.auth.auth import Auth
 from api.v1.auth.basic_auth import BasicAuth
+from api.v1.auth.composite_auth import CompositeAuth
+from api.v1.metrics import (REGISTRY, REQUEST_COUNT, REQUEST_LATENCY,
+                            CallbackCounter)
 
 
 app = Flask(__name__)
 app.register_blueprint(app_views)
 CORS(app, resources={r"/api/v1/*": {"origins": "*"}})
 
+EXCLUDED_PATHS = [
+    '/api/v1/status/',
+    '/api/v1/unauthorized/',
+    '/api/v1/forbidden/',
+    '/api/v1/auth_session/login/',
+    '/api/v1/metrics/',
+]
+
+AUTH_TYPES = {
+    'auth': Auth,
+    'basic_auth': BasicAuth,
+    'session_auth': SessionAuth,
+    'session_exp_auth': SessionExpAuth,
+    'session_db_auth': SessionDBAuth,
+    'session_token_auth': SessionTokenAuth,
+}
+
 auth = None
-auth_type = getenv('AUTH_TYPE', 'auth')
-if auth_type == 'auth':
-    auth = Auth()
+# several comma-separated types make a CompositeAuth trying each in turn
+auth_types = [
+    name.strip() for name in getenv('AUTH_TYPE', 'auth').split(',')
+    if name.strip() in AUTH_TYPES
+]
+if len(auth_types) == 1:
+    auth = AUTH_TYPES[auth_types[0]]()
+elif len(auth_types) > 1:
+    auth = CompositeAuth([AUTH_TYPES[name]() for name in auth_types])
+
+
+def auth_cache_lookups() -> dict:
+    """Returns the hits and misses of the caches of the authentication.
+    """
+    samples = {}
+    auths = auth.auths if isinstance(auth, CompositeAuth) else [auth]
+    for instance in auths:
+        for cache_name in ('credential_cache', 'failure_cache'):
+            cache = getattr(instance, cache_name, None)
+            if cache is None:
+                continue
+            stats = cache.stats()
+            labels = (type(instance).__name__, cache_name)
+            samples[labels + ('hit',)] = stats['hits']
+            samples[labels + ('miss',)] = stats['misses']
+    return samples
+
+
+REGISTRY.append(CallbackCounter(
+    'auth_cache_lookups_total',
+    'Lookups in the authentication caches, by result.',
+    ('auth_type', 'cache', 'result'), auth_cache_lookups))
+
 
-if auth_type == 'basic_auth':
-    auth = BasicAuth()
+@app.before_request
+def start_timer():
+    """Notes when the request started, before it is authenticated.
+    """
+    request.start_time = time.perf_counter()
 
-if auth_type == 'session_auth':
-    auth = SessionAuth()
 
-if auth_type == 'session_exp_auth':
-    auth = SessionExpAuth()
+@app.after_request
+def record_metrics(response):
+    """Records the latency and status of a request, by route.
 
-if auth_type == 'session_db_auth':
-    auth = SessionDBAuth()
+    The route is the URL rule (e.g. `/api/v1/users/<user_id>`), which
+    keeps the number of series bounded; a streamed body is timed up to
+    its first byte.
+    """
+    start = getattr(request, 'start_time', None)
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        REQUEST_LATENCY.observe(time.perf_counter() - start,
+                                request.method, route)
+        REQUEST_COUNT.inc(request.method, route, str(response.status_code))
+    return response
 
 
 @app.before_request
@@ -41,20 +104,14 @@ def authenticate_client():
     """Authenticates a user before processing any auth request.
     """
     if auth:
-        excluded_paths = [
-            '/api/v1/status/',
-            '/api/v1/unauthorized/',
-            '/api/v1/forbidden/',
-            '/api/v1/auth_session/login/',
-        ]
-        if auth.require_auth(request.path, excluded_paths):
-            user = auth.current_user(request)
-            if auth.authorization_header(request) is None and \
-                    auth.session_cookie(request) is None:
+        if auth.require_auth(request.path, EXCLUDED_PATHS):
+            context = auth.context(request)
+            if context.authorization_header is None and \
+                    context.session_id is None:
                 abort(401)
-            if user is None:
+            if context.user is None:
                 abort(403)
-            request.current_user = user
+            request.current_user = context.user
 
 
 @app.errorhandler(404)
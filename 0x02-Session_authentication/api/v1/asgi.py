@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+ASGI entry point for the API
+
+Serves the routes and authentication types of `api.v1.app` from an event
+loop, e.g. `uvicorn api.v1.asgi:application`.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import io
+import json
+from os import getenv
+import sys
+import threading
+from typing import List, Tuple
+
+from werkzeug.wrappers import Request
+
+from api.v1.app import EXCLUDED_PATHS, app, auth
+from api.v1.auth.auth import Auth
+from api.v1.auth.composite_auth import CompositeAuth
+from api.v1.auth.session_db_auth import SessionDBAuth
+from models.base import flush, storage
+
+
+def memory_only(auth: Auth) -> bool:
+    """Tells whether authenticating and reading objects only reads memory.
+
+    Not unless the storage engine says so (the sqlite engine, or the json
+    one with DB_SHARED, stat, read or reload files; the json one with
+    DB_LOAD_MODE=lazy only builds objects from memory), nor with
+    session_db_auth, whose lookups also reap expired sessions.
+    """
+    if not storage().memory_only():
+        return False
+    if auth is None:
+        return True
+    auths = auth.auths if isinstance(auth, CompositeAuth) else [auth]
+    return not any(isinstance(a, SessionDBAuth) for a in auths)
+
+
+def wsgi_environ(scope: dict, body: bytes) -> dict:
+    """Builds the WSGI environ of an ASGI HTTP request.
+    """
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': '',
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': str(server[0]),
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/' + scope.get('http_version', '1.1'),
+        'REMOTE_ADDR': client[0],
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.input_terminated': True,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_LENGTH':
+            continue
+        key = name if name == 'CONTENT_TYPE' else 'HTTP_' + name
+        if key in environ:
+            value = environ[key] + ('; ' if name == 'COOKIE' else ',') + value
+        environ[key] = value
+    return environ
+
+
+class AsyncApp:
+    """ASGI application running the Flask app.
+
+    When authentication and reads only touch memory (see `memory_only`),
+    the event loop resolves the user of every request, answers the ones
+    refused with their 401 or 403, and runs GET, HEAD and OPTIONS requests
+    itself, except on `offloaded_paths`, whose cost grows with the store.
+    Writes, those routes, and every request otherwise, run through the
+    Flask app in a pool of ASGI_WORKERS threads (default 16), where every
+    blocking store call happens: journal writes, `save_to_file`
+    compactions and, with DB_SHARED, `load_from_file` reloads. Their body
+    is streamed from the pool in `chunk_size` messages, at most
+    `max_chunks` of them waiting to be sent. Beyond ASGI_MAX_PENDING
+    requests (default 1024) waiting for or running in the pool, new ones
+    get a 503.
+    """
+
+    reading_methods = ('GET', 'HEAD', 'OPTIONS')
+    # list and serialization routes, without their trailing slash
+    offloaded_paths = ('/api/v1/users', '/api/v1/metrics')
+    chunk_size = 1 << 16
+    max_chunks = 4
+
+    def __init__(self, wsgi_app=app, auth: Auth = auth,
+                 excluded_paths: List[str] = EXCLUDED_PATHS,
+                 workers: int = None, max_pending: int = None) -> None:
+        """Initializes a new AsyncApp, its threads start on first use.
+        """
+        if workers is None:
+            workers = int(getenv('ASGI_WORKERS', '16'))
+        if max_pending is None:
+            max_pending = int(getenv('ASGI_MAX_PENDING', '1024'))
+        self.wsgi_app = wsgi_app
+        self.auth = auth
+        self.excluded_paths = excluded_paths
+        self.on_loop = memory_only(auth)
+        self.max_pending = max_pending
+        self.pending = 0
+        self.executor = ThreadPoolExecutor(max_workers=workers,
+                                           thread_name_prefix='asgi')
+
+    async def __call__(self, scope: dict, receive, send) -> None:
+        """Handles one ASGI connection scope.
+        """
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+        environ = wsgi_environ(scope, await self.read_body(receive))
+        if self.on_loop and (self.light(scope) or
+                             self.refused(scope['path'], environ)):
+            status, headers, body = self.call_wsgi(environ)
+            await self.send_start(send, status, headers)
+            await send({'type': 'http.response.body', 'body': body})
+        elif self.pending >= self.max_pending:
+            await self.send_start(send, 503, [
+                ('Content-Type', 'application/json'), ('Retry-After', '1')])
+            await send({'type': 'http.response.body', 'body': json.dumps(
+                {"error": "Service Unavailable"}).encode()})
+        else:
+            self.pending += 1
+            try:
+                await self.stream_wsgi(environ, send)
+            finally:
+                self.pending -= 1
+
+    def light(self, scope: dict) -> bool:
+        """Tells whether a request reads little enough to run on the loop.
+        """
+        return scope['method'] in self.reading_methods and \
+            scope['path'].rstrip('/') not in self.offloaded_paths
+
+    async def send_start(self, send, status: int, headers: list) -> None:
+        """Sends the status and headers of a response.
+        """
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [
+                (name.lower().encode('latin-1'), value.encode('latin-1'))
+                for name, value in headers
+            ],
+        })
+
+    async def read_body(self, receive) -> bytes:
+        """Reads the whole body of a request.
+        """
+        chunks = []
+        while True:
+            message = await receive()
+            if message['type'] != 'http.request':
+                break
+            chunks.append(message.get('body', b''))
+            if not message.get('more_body', False):
+                break
+        return b''.join(chunks)
+
+    def refused(self, path: str, environ: dict) -> bool:
+        """Resolves the user of a request, on the event loop; True if the
+        request requires authentication and has no user.
+        """
+        if self.auth is None or \
+                not self.auth.require_auth(path, self.excluded_paths):
+            return False
+        return self.auth.context(Request(environ)).user is None
+
+    def call_wsgi(self, environ: dict) -> Tuple[int, list, bytes]:
+        """Runs the Flask app on a request, returns its status, headers and
+        whole body: streamed bodies are read in the same thread, which
+        holds their request context.
+        """
+        response = []
+
+        def start_response(status, headers, exc_info=None):
+            response[:] = [int(status.split(' ', 1)[0]), headers]
+
+        iterable = self.wsgi_app(environ, start_response)
+        try:
+            body = b''.join(iterable)
+        finally:
+            if hasattr(iterable, 'close'):
+                iterable.close()
+        return response[0], response[1], body
+
+    async def stream_wsgi(self, environ: dict, send) -> None:
+        """Runs the Flask app on a request in the pool, and sends its
+        response as it comes: one pool thread iterates the body, which
+        holds its request context, and hands it over in `chunk_size`
+        pieces through a queue of `max_chunks`, so that a slow client
+        holds back the thread instead of buffering the whole body.
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(self.max_chunks)
+        closed = threading.Event()
+
+        def put(item) -> None:
+            asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+        def produce() -> None:
+            response = []
+
+            def start_response(status, headers, exc_info=None):
+                response[:] = [int(status.split(' ', 1)[0]), headers]
+
+            iterable = None
+            try:
+                iterable = self.wsgi_app(environ, start_response)
+                put(('start', response[0], response[1]))
+                chunks, size = [], 0
+                for chunk in iterable:
+                    if closed.is_set():
+                        return
+                    chunks.append(chunk)
+                    size += len(chunk)
+                    if size >= self.chunk_size:
+                        put(('body', b''.join(chunks)))
+                        chunks, size = [], 0
+                if not closed.is_set():
+                    put(('body', b''.join(chunks)))
+                    put(None)
+            except BaseException as e:
+                if not closed.is_set():
+                    put(('error', e))
+            finally:
+                if hasattr(iterable, 'close'):
+                    iterable.close()
+
+        loop.run_in_executor(self.executor, produce)
+        try:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                if item[0] == 'error':
+                    raise item[1]
+                if item[0] == 'start':
+                    await self.send_start(send, item[1], item[2])
+                elif item[1]:
+                    await send({'type': 'http.response.body',
+                                'body': item[1], 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            # a client gone or an error: stop the thread, free its put()
+            closed.set()
+            while not queue.empty():
+                queue.get_nowait()
+
+    async def lifespan(self, receive, send) -> None:
+        """Handles the startup and shutdown events of the server: pending
+        journal writes are flushed in the pool at shutdown.
+        """
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await asyncio.get_running_loop().run_in_executor(
+                    self.executor, flush)
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+application = AsyncApp()
@@ -4,17 +4,167 @@
 Provides functionalities for authentication in the API.
 """
 import os
-import re
-from typing import List, TypeVar
+import time
+from functools import cached_property
+from typing import List, Tuple, TypeVar
 from flask import request
 
+from api.v1.metrics import AUTH_LATENCY
+from .cache import TTLCache
+
+
+class AuthContext:
+    """Authentication Context of One Request
+
+    The Authorization header and the session cookie are read once, and
+    the user is resolved once, whichever code asks first: that is where
+    `current_user` is timed, by authentication type.
+    """
+
+    def __init__(self, auth: 'Auth', request) -> None:
+        """Initialize AuthContext instance.
+
+        Args:
+            auth (Auth): The authentication resolving the user.
+            request (Request): The request object.
+        """
+        self.auth = auth
+        self.request = request
+        self.scheme = None
+
+    @cached_property
+    def authorization_header(self) -> str:
+        """str: The Authorization header field, or None."""
+        return self.request.headers.get('Authorization', None)
+
+    @cached_property
+    def session_id(self) -> str:
+        """str: The value of the cookie named SESSION_NAME, or None."""
+        return self.request.cookies.get(os.getenv('SESSION_NAME'))
+
+    @cached_property
+    def user(self) -> TypeVar('User'):  # type: ignore
+        """TypeVar('User'): The authenticated user, or None."""
+        start = time.perf_counter()
+        user = self.auth.current_user(self.request)
+        AUTH_LATENCY.observe(time.perf_counter() - start,
+                             type(self.auth).__name__,
+                             'none' if user is None else 'user')
+        if user is not None and self.scheme is None:
+            self.scheme = self.auth.scheme
+        return user
+
 
 class Auth:
-    """Authentication class"""
+    """Authentication class
+
+    Credentials that recently failed are remembered for
+    AUTH_FAILURE_CACHE_TTL seconds (default 10), up to
+    AUTH_FAILURE_CACHE_SIZE entries (default 10000, 0 disables the cache),
+    so repeating them is rejected without parsing, lookups or hashing. An
+    entry records the revisions of the `failure_stores` it was checked
+    against, and is dropped as soon as one of them changes.
+    """
+
+    scheme = None
+    failure_stores = ()
+
+    def __init__(self) -> None:
+        """Initialize Auth instance."""
+        self.exclusion_prefixes = {}
+        try:
+            cache_size = int(os.getenv('AUTH_FAILURE_CACHE_SIZE', '10000'))
+        except Exception:
+            cache_size = 10000
+        try:
+            cache_ttl = float(os.getenv('AUTH_FAILURE_CACHE_TTL', '10'))
+        except Exception:
+            cache_ttl = 10
+        self.failure_cache = TTLCache(cache_size, cache_ttl)
+
+    def failure_key(self, credential: str) -> int:
+        """Failure Cache Key
+
+        The keyed string hash of the interpreter: far cheaper than an HMAC
+        and just as unpredictable from outside the process. A collision
+        can only reject a valid credential until the entry expires, never
+        accept an invalid one.
+
+        Args:
+            credential (str): An Authorization header or a session ID.
+
+        Returns:
+            int: The key of the credential in the failure cache.
+        """
+        return hash(credential)
+
+    def revisions(self) -> Tuple[int, ...]:
+        """Revisions of the Stores Credentials are Checked Against
+
+        Read them before checking a credential: a change made during the
+        check then invalidates the failure recorded after it.
+
+        Returns:
+            Tuple[int, ...]: The revision of each class in `failure_stores`.
+        """
+        return tuple(cls.revision() for cls in self.failure_stores)
+
+    def known_failure(self, credential: str,
+                      revisions: Tuple[int, ...]) -> bool:
+        """Check if a Credential Failed Recently
+
+        Args:
+            credential (str): An Authorization header or a session ID.
+            revisions (Tuple[int, ...]): The current `revisions()`.
+
+        Returns:
+            bool: True if the credential failed against these revisions,
+            False otherwise.
+        """
+        if type(credential) is not str or self.failure_cache.max_size <= 0:
+            return False
+        return self.failure_cache.get(
+            self.failure_key(credential),
+            lambda failed_at: failed_at == revisions,
+        ) is not None
+
+    def record_failure(self, credential: str,
+                       revisions: Tuple[int, ...]) -> None:
+        """Remember a Failed Credential
+
+        Args:
+            credential (str): An Authorization header or a session ID.
+            revisions (Tuple[int, ...]): The `revisions()` read before the
+            credential was checked.
+        """
+        if type(credential) is str and self.failure_cache.max_size > 0:
+            self.failure_cache.set(self.failure_key(credential), revisions)
+
+    def exclusion_prefix(self, exclusion_path: str) -> str:
+        """Exclusion Path Prefix
+
+        An excluded path matches every path starting with it, once a
+        trailing `*` or `/` is dropped: `/api/v1/stat*` excludes
+        `/api/v1/stats`, and `/api/v1/status/` excludes `/api/v1/status`.
+
+        Args:
+            exclusion_path (str): An excluded path.
+
+        Returns:
+            str: The prefix of the paths it excludes.
+        """
+        exclusion_path = exclusion_path.strip()
+        if exclusion_path[-1:] in ('*', '/'):
+            return exclusion_path[0:-1]
+        return exclusion_path
 
     def require_auth(self, path: str, excluded_paths: List[str]) -> bool:
         """Check if Path Requires Authentication
 
+        The prefixes of each distinct list of excluded paths are computed
+        once and cached on the instance, so a request costs a single
+        `str.startswith` call whatever the number of excluded paths.
+
         Args:
             path (str): The path to check for authentication.
             excluded_paths (List[str]): List of paths excluded
@@ -23,18 +173,51 @@ class Auth:
         Returns:
             bool: True if authentication is required, False otherwise.
         """
-        if path is not None and excluded_paths is not None:
-            for exclusion_path in map(lambda x: x.strip(), excluded_paths):
-                pattern = ''
-                if exclusion_path[-1] == '*':
-                    pattern = '{}.*'.format(exclusion_path[0:-1])
-                elif exclusion_path[-1] == '/':
-                    pattern = '{}/*'.format(exclusion_path[0:-1])
-                else:
-                    pattern = '{}/*'.format(exclusion_path)
-                if re.match(pattern, path):
-                    return False
-        return True
+        if path is None or excluded_paths is None:
+            return True
+        key = tuple(excluded_paths)
+        prefixes = self.exclusion_prefixes.get(key)
+        if prefixes is None:
+            prefixes = tuple(
+                self.exclusion_prefix(exclusion_path)
+                for exclusion_path in excluded_paths
+                if exclusion_path.strip()
+            )
+            if len(self.exclusion_prefixes) >= 128:
+                self.exclusion_prefixes.clear()
+            self.exclusion_prefixes[key] = prefixes
+        return not path.startswith(prefixes)
+
+    def context(self, request) -> AuthContext:
+        """Get Authentication Context
+
+        Creates the context of a request on first use, and keeps it in the
+        WSGI environ of the request as `api.auth_context`, so that every
+        request object wrapping the same environ shares it (the ASGI entry
+        point resolves the user before Flask sees the request), or else on
+        the request as `auth_context`.
+
+        Args:
+            request (Request): The request object.
+
+        Returns:
+            AuthContext: The authentication context of the request.
+        """
+        environ = getattr(request, 'environ', None)
+        if isinstance(environ, dict):
+            context = environ.get('api.auth_context')
+            if context is None:
+                context = environ['api.auth_context'] = \
+                    AuthContext(self, request)
+            return context
+        context = getattr(request, 'auth_context', None)
+        if context is None:
+            context = AuthContext(self, request)
+            try:
+                request.auth_context = context
+            except AttributeError:
+                pass
+        return context
 
     def authorization_header(self, request=None) -> str:
         """Get Authorization Header Field
@@ -46,7 +229,7 @@ class Auth:
             str: The authorization header field from the request.
         """
         if request is not None:
-            return request.headers.get('Authorization', None)
+            return self.context(request).authorization_header
         return None
 
     def current_user(self, request=None) -> TypeVar('User'):  # type: ignore
@@ -72,5 +255,4 @@ class Auth:
             str: The value of the session cookie.
         """
         if request is not None:
-            cookie_name = os.getenv('SESSION_NAME')
-            return request.cookies.get(cookie_name)
+            return self.context(request).session_id
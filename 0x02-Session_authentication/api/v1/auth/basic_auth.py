@@ -3,15 +3,44 @@
 """
 import base64
 import binascii
+import hashlib
+import hmac
+import os
 import re
 
 from models.user import User
 from .auth import Auth
+from .cache import TTLCache
 
 
 class BasicAuth(Auth):
     """Basic authentication class.
+
+    Verified credentials are cached for BASIC_AUTH_CACHE_TTL seconds
+    (default 60), up to BASIC_AUTH_CACHE_SIZE entries (default 1024, 0
+    disables the cache). Entries are keyed by an HMAC of the Authorization
+    header under a per-process secret, never by the header itself. Headers
+    that failed land in the failure cache of `Auth` until a user is saved
+    or removed.
     """
+
+    scheme = 'basic'
+    failure_stores = (User,)
+
+    def __init__(self) -> None:
+        """Initialize BasicAuth instance."""
+        super().__init__()
+        try:
+            cache_size = int(os.getenv('BASIC_AUTH_CACHE_SIZE', '1024'))
+        except Exception:
+            cache_size = 1024
+        try:
+            cache_ttl = float(os.getenv('BASIC_AUTH_CACHE_TTL', '60'))
+        except Exception:
+            cache_ttl = 60
+        self.credential_cache = TTLCache(cache_size, cache_ttl)
+        self.credential_key_secret = os.urandom(32)
+
     def extract_base64_authorization_header(
             self,
             authorization_header: str) -> str:
@@ -117,10 +146,60 @@ class BasicAuth(Auth):
                 return users[0]
         return None
 
+    def credential_key(self, authorization_header: str) -> bytes:
+        """Credential Cache Key
+
+        Args:
+            authorization_header (str): The Authorization header string.
+
+        Returns:
+            bytes: HMAC-SHA256 of the header under the per-process secret.
+        """
+        return hmac.new(
+            self.credential_key_secret,
+            authorization_header.encode('utf-8', 'surrogateescape'),
+            hashlib.sha256,
+        ).digest()
+
+    def cached_user(
+            self,
+            authorization_header: str) -> TypeVar('User'):  # type: ignore
+        """Retrieve User from Verified Credentials Cache
+
+        An entry is only valid while its user exists with the email and
+        password hash it was verified against: removing the user, or
+        changing its email or password, invalidates it.
+
+        Args:
+            authorization_header (str): The Authorization header string.
+
+        Returns:
+            TypeVar('User'): The user object on a cache hit, otherwise None.
+        """
+        if type(authorization_header) is not str:
+            return None
+        found = []
+
+        def validate(entry) -> bool:
+            user_id, email, password = entry
+            user = User.get(user_id)
+            if user is None or user.email != email or \
+                    user.password != password:
+                return False
+            found.append(user)
+            return True
+
+        key = self.credential_key(authorization_header)
+        if self.credential_cache.get(key, validate) is None:
+            return None
+        return found[0]
+
     def current_user(self, request=None) -> TypeVar('User'):  # type: ignore
         """Retrieve Current User from Request
 
-        Retrieves the user from a request.
+        Retrieves the user from a request, from the verified credentials
+        cache when possible. A header that failed recently is rejected
+        first, without being hashed, decoded or checked again.
 
         Args:
             request (Request): The Flask request object. Defaults to None.
@@ -130,7 +209,21 @@ class BasicAuth(Auth):
             otherwise None.
         """
         auth_header = self.authorization_header(request)
+        revisions = self.revisions()
+        if self.known_failure(auth_header, revisions):
+            return None
+        user = self.cached_user(auth_header)
+        if user is not None:
+            return user
         bs64_auth_token = self.extract_base64_authorization_header(auth_header)
         auth_token = self.decode_base64_authorization_header(bs64_auth_token)
         email, password = self.extract_user_credentials(auth_token)
-        return self.user_object_from_credentials(email, password)
+        user = self.user_object_from_credentials(email, password)
+        if user is not None:
+            self.credential_cache.set(
+                self.credential_key(auth_header),
+                (user.id, user.email, user.password),
+            )
+        else:
+            self.record_failure(auth_header, revisions)
+        return user
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""Cache Module
+
+Provides the bounded caches used by the authentication classes.
+"""
+from collections import OrderedDict
+import threading
+import time
+from typing import Callable, Hashable
+
+
+class TTLCache:
+    """Bounded LRU cache whose entries expire after `ttl` seconds
+
+    Expiry uses the monotonic clock, so wall clock changes do not extend
+    or cut short an entry. A `max_size` of 0 disables the cache.
+    """
+
+    def __init__(self, max_size: int, ttl: float) -> None:
+        """Initialize an empty TTLCache.
+
+        Args:
+            max_size (int): Maximum number of entries, the least recently
+            used one is evicted beyond it.
+            ttl (float): Lifetime of an entry, in seconds.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, validate: Callable = None):
+        """Get a Cached Value
+
+        Args:
+            key (Hashable): The key of the entry.
+            validate (Callable): Optional check of the value; an entry
+            failing it is dropped like an expired one.
+
+        Returns:
+            The value if the entry is present, fresh and valid,
+            otherwise None.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self.entries.move_to_end(key)
+            elif entry is not None:
+                del self.entries[key]
+                entry = None
+        if entry is not None and validate is not None and \
+                not validate(entry[1]):
+            self.discard(key)
+            entry = None
+        with self.lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value) -> None:
+        """Cache a Value
+
+        Args:
+            key (Hashable): The key of the entry.
+            value: The value, which must not be None.
+        """
+        if self.max_size <= 0:
+            return
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def discard(self, key: Hashable) -> None:
+        """Drop an entry, if present.
+
+        Args:
+            key (Hashable): The key of the entry.
+        """
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self) -> None:
+        """Drop every entry."""
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> dict:
+        """Cache Statistics
+
+        Returns:
+            dict: Current size, maximum size, hits and misses.
+        """
+        with self.lock:
+            return {
+                'size': len(self.entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
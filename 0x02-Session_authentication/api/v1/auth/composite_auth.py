@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""Composite Authentication Module
+
+Provides authentication through several schemes for the API.
+"""
+import time
+from typing import List, TypeVar
+
+from api.v1.metrics import AUTH_LATENCY
+from .auth import Auth
+
+# schemes from the cheapest to check to the most expensive: a session
+# cookie costs a lookup or an HMAC, Basic credentials a password hash
+SCHEME_ORDER = ('session', 'basic')
+
+
+class CompositeAuth(Auth):
+    """Composite Authentication Class
+
+    Tries each authentication in turn, in one pass over the request
+    credentials: an authentication is skipped when the request lacks its
+    credential (session cookie or Authorization header). Cheapest schemes
+    come first (see `SCHEME_ORDER`), whatever the order of AUTH_TYPE:
+    a request carrying a session cookie never pays for Basic credentials
+    verification. Authentications of the same scheme keep their order;
+    the first session authentication handles login and logout. Each
+    authentication tried is timed under its own type.
+    """
+
+    def __init__(self, auths: List[Auth]) -> None:
+        """Initialize CompositeAuth instance.
+
+        Args:
+            auths (List[Auth]): The authentications to try.
+        """
+        super().__init__()
+        self.auths = sorted(auths, key=lambda auth: (
+            SCHEME_ORDER.index(auth.scheme)
+            if auth.scheme in SCHEME_ORDER else len(SCHEME_ORDER)))
+        self.session_auth = next(
+            (auth for auth in auths if auth.scheme == 'session'), None)
+
+    def current_user(self, request=None) -> TypeVar('User'):  # type: ignore
+        """Get Current User
+
+        Args:
+            request (Request): The request object.
+
+        Returns:
+            TypeVar('User'): The user of the first authentication that
+            accepts the request credentials, otherwise None.
+        """
+        if request is None:
+            return None
+        context = self.context(request)
+        for auth in self.auths:
+            if auth.scheme == 'session' and context.session_id is None:
+                continue
+            if auth.scheme == 'basic' and \
+                    context.authorization_header is None:
+                continue
+            start = time.perf_counter()
+            user = auth.current_user(request)
+            AUTH_LATENCY.observe(time.perf_counter() - start,
+                                 type(auth).__name__,
+                                 'none' if user is None else 'user')
+            if user is not None:
+                context.scheme = auth.scheme
+                return user
+        return None
+
+    def create_session(self, user_id: str = None) -> str:
+        """Create Session
+
+        Args:
+            user_id (str): The user ID associated with the session.
+
+        Returns:
+            str: The session ID created by the session authentication,
+            None without one.
+        """
+        if self.session_auth is None:
+            return None
+        return self.session_auth.create_session(user_id)
+
+    def destroy_session(self, request=None) -> bool:
+        """Destroy Session
+
+        Args:
+            request: The Flask request object.
+
+        Returns:
+            bool: True if the session authentication destroyed the
+            session, False otherwise.
+        """
+        if self.session_auth is None:
+            return False
+        return self.session_auth.destroy_session(request)
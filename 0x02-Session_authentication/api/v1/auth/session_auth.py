@@ -3,15 +3,69 @@
 
 Provides session authentication functionality for the API.
 """
+import atexit
+import os
+import threading
 from uuid import uuid4
 from api.v1.auth.auth import Auth
+from models.persistence import Flusher
 from models.user import User
 
 
+SNAPSHOTTERS = {}
+SNAPSHOTTERS_LOCK = threading.Lock()
+
+
 class SessionAuth(Auth):
-    """Session Authentication Class"""
+    """Session Authentication Class
+
+    The session map is snapshotted every SESSION_SNAPSHOT_INTERVAL
+    seconds (default 60, 0 disables snapshots) and at exit by a
+    background thread, to SESSION_SNAPSHOT_FILE (default
+    `.sessions_<Class>.tsv`), and restored at startup: a restart does not
+    log users out. The snapshot holds one tab-separated line per session
+    and, as session IDs are bearer credentials, is only readable by the
+    user running the API (mode 0600).
+
+    Logouts are durable at once: each one appends the session ID to
+    `<SESSION_SNAPSHOT_FILE>.logouts` (mode 0600, synced to disk), whose
+    sessions are skipped on restore. Each snapshot drops the logouts it
+    already reflects from that log.
 
+    Unknown session IDs land in the failure cache of `Auth`, until a user
+    is saved or removed or a session with that ID is created.
+
+    Each subclass gets its own session map: their entries differ (user ID
+    here, session dict for `SessionExpAuth`), and a CompositeAuth may try
+    several of them on the same session ID.
+    """
+
+    scheme = 'session'
+    failure_stores = (User,)
     user_id_by_session_id = {}
+    session_snapshot = True
+
+    def __init_subclass__(cls, **kwargs) -> None:
+        """Give the subclass its own session map."""
+        super().__init_subclass__(**kwargs)
+        cls.user_id_by_session_id = {}
+
+    def __init__(self) -> None:
+        """Initialize SessionAuth instance and restore saved sessions."""
+        super().__init__()
+        self.snapshot_lock = threading.Lock()
+        self.snapshot_file = os.getenv(
+            'SESSION_SNAPSHOT_FILE',
+            '.sessions_{}.tsv'.format(self.__class__.__name__))
+        try:
+            interval = float(os.getenv('SESSION_SNAPSHOT_INTERVAL', '60'))
+        except Exception:
+            interval = 60
+        self.logout_lock = threading.Lock()
+        self.logout_file = "{}.logouts".format(self.snapshot_file)
+        self.log_logouts = self.session_snapshot and interval > 0
+        if self.log_logouts:
+            self.start_snapshots(interval)
 
     def create_session(self, user_id: str = None) -> str:
         """Create Session
@@ -27,6 +81,7 @@ class SessionAuth(Auth):
         if type(user_id) is str:
             session_id = str(uuid4())
             self.user_id_by_session_id[session_id] = user_id
+            self.failure_cache.discard(self.failure_key(session_id))
             return session_id
 
     def user_id_for_session_id(self, session_id: str = None) -> str:
@@ -41,12 +96,15 @@ class SessionAuth(Auth):
             str: The user ID associated with the session ID.
         """
         if type(session_id) is str:
-            return self.user_id_by_session_id.get(session_id)
+            user_id = self.user_id_by_session_id.get(session_id)
+            if type(user_id) is str:
+                return user_id
 
     def current_user(self, request=None) -> User:
         """Current User
 
-        Retrieves the user associated with the request.
+        Retrieves the user associated with the request. A session ID that
+        failed recently is rejected without being looked up again.
 
         Args:
             request: The Flask request object.
@@ -54,8 +112,14 @@ class SessionAuth(Auth):
         Returns:
             User: The user object associated with the request.
         """
-        user_id = self.user_id_for_session_id(self.session_cookie(request))
-        return User.get(user_id)
+        session_id = self.session_cookie(request)
+        revisions = self.revisions()
+        if self.known_failure(session_id, revisions):
+            return None
+        user = User.get(self.user_id_for_session_id(session_id))
+        if user is None:
+            self.record_failure(session_id, revisions)
+        return user
 
     def destroy_session(self, request=None) -> bool:
         """Destroy Session
@@ -75,4 +139,163 @@ class SessionAuth(Auth):
             return False
         if session_id in self.user_id_by_session_id:
             del self.user_id_by_session_id[session_id]
+        if self.log_logouts:
+            self.log_logout(session_id)
         return True
+
+    def log_logout(self, session_id: str) -> None:
+        """Append a Logout to the Logout Log
+
+        The line is synced to disk before the logout returns, so that a
+        crash before the next snapshot does not restore the session.
+
+        Args:
+            session_id (str): The ID of the destroyed session.
+        """
+        if '\n' in session_id:
+            return
+        with self.logout_lock:
+            fd = os.open(self.logout_file,
+                         os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+            try:
+                os.write(fd, (session_id + '\n').encode())
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def logged_out(self) -> set:
+        """Session IDs of the Logout Log
+
+        Returns:
+            set: The IDs of the sessions destroyed since the snapshot.
+        """
+        try:
+            with open(self.logout_file, 'r') as f:
+                return {line[:-1] for line in f if line.endswith('\n')}
+        except FileNotFoundError:
+            return set()
+
+    def logout_log_size(self) -> int:
+        """Size of the Logout Log
+
+        Returns:
+            int: The size in bytes of the logout log, 0 if it is missing.
+        """
+        try:
+            return os.stat(self.logout_file).st_size
+        except FileNotFoundError:
+            return 0
+
+    def trim_logouts(self, offset: int) -> None:
+        """Drop the Logouts a Snapshot Reflects
+
+        Keeps the logouts appended past `offset`, which may have happened
+        after the snapshot copied the session map.
+
+        Args:
+            offset (int): Size of the logout log when the map was copied.
+        """
+        if offset == 0:
+            return
+        with self.logout_lock:
+            with open(self.logout_file, 'rb') as f:
+                f.seek(offset)
+                rest = f.read()
+            tmp_path = "{}.tmp".format(self.logout_file)
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+                         0o600)
+            os.fchmod(fd, 0o600)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(rest)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.logout_file)
+
+    def start_snapshots(self, interval: float) -> None:
+        """Restore Sessions and Start Snapshotting Them
+
+        Only the first instance bound to a snapshot file restores it and
+        starts its snapshot thread.
+
+        Args:
+            interval (float): Seconds between two snapshots.
+        """
+        with SNAPSHOTTERS_LOCK:
+            if self.snapshot_file in SNAPSHOTTERS:
+                return
+            self.restore_sessions()
+            snapshotter = Flusher(self.save_sessions, interval,
+                                  name="session-snapshot")
+            SNAPSHOTTERS[self.snapshot_file] = snapshotter
+        snapshotter.start()
+        atexit.register(self.save_sessions)
+
+    def session_record(self, session_id: str, session) -> list:
+        """Snapshot Fields of a Session
+
+        Args:
+            session_id (str): The session ID.
+            session: The entry of the session in the session map.
+
+        Returns:
+            list: The fields to save, None to skip the session.
+        """
+        return [session_id, session]
+
+    def restore_session(self, fields: list) -> None:
+        """Restore a Session from its Snapshot Fields
+
+        Args:
+            fields (list): The fields returned by `session_record`.
+        """
+        if len(fields) == 2:
+            self.user_id_by_session_id.setdefault(fields[0], fields[1])
+
+    def save_sessions(self) -> None:
+        """Snapshot the Session Map
+
+        Runs in the snapshot thread and at exit: request threads only pay
+        for the copy of the map, taken in one step. Logouts logged before
+        the copy are in it, and are then dropped from the logout log.
+        """
+        tmp_path = "{}.tmp".format(self.snapshot_file)
+        # the snapshot thread and the call at exit take turns on tmp_path
+        with self.snapshot_lock:
+            with self.logout_lock:
+                offset = self.logout_log_size()
+            sessions = self.user_id_by_session_id.copy()
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+                         0o600)
+            os.fchmod(fd, 0o600)
+            with os.fdopen(fd, 'w') as f:
+                for session_id, session in sessions.items():
+                    fields = self.session_record(session_id, session)
+                    if fields is None or \
+                            any(type(v) is not str or '\t' in v or
+                                '\n' in v for v in fields):
+                        continue
+                    f.write('\t'.join(fields))
+                    f.write('\n')
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.snapshot_file)
+            self.trim_logouts(offset)
+
+    def restore_sessions(self) -> int:
+        """Restore the Sessions of the Last Snapshot
+
+        Returns:
+            int: The number of sessions restored.
+        """
+        if not os.path.exists(self.snapshot_file):
+            return 0
+        logged_out = self.logged_out()
+        before = len(self.user_id_by_session_id)
+        with open(self.snapshot_file, 'r') as f:
+            for line in f:
+                if not line.endswith('\n'):
+                    continue
+                fields = line[:-1].split('\t')
+                if fields[0] not in logged_out:
+                    self.restore_session(fields)
+        return len(self.user_id_by_session_id) - before
@@ -4,15 +4,47 @@
 Provides session authentication functionality with expiration
 and storage support for the API.
 """
+import os
+import threading
+import time
+from uuid import uuid4
 from flask import request
 from datetime import datetime, timedelta
 
+from models.user import User
 from models.user_session import UserSession
 from .session_exp_auth import SessionExpAuth
 
 
 class SessionDBAuth(SessionExpAuth):
-    """Session Authentication Class with Expiration and Storage Support"""
+    """Session Authentication Class with Expiration and Storage Support
+
+    Sessions live in the UserSession store only, loaded at startup:
+    lookups go through its `session_id` index and each login or logout
+    writes one record. Every SESSION_REAP_INTERVAL seconds (default 60),
+    one request also removes up to SESSION_REAP_BATCH (default 1000)
+    expired sessions, oldest first, read from the `created_at` index.
+    Failed session IDs are remembered until a User or UserSession changes.
+    """
+
+    session_snapshot = False
+    failure_stores = (User, UserSession)
+
+    def __init__(self) -> None:
+        """Initialize SessionDBAuth instance and load stored sessions."""
+        super().__init__()
+        try:
+            self.reap_interval = float(
+                os.getenv('SESSION_REAP_INTERVAL', '60'))
+        except Exception:
+            self.reap_interval = 60
+        try:
+            self.reap_batch = int(os.getenv('SESSION_REAP_BATCH', '1000'))
+        except Exception:
+            self.reap_batch = 1000
+        self.next_reap = time.monotonic() + self.reap_interval
+        self.reap_lock = threading.Lock()
+        UserSession.load_from_file()
 
     def create_session(self, user_id=None) -> str:
         """Create and Store Session
@@ -22,8 +54,8 @@ class SessionDBAuth(SessionExpAuth):
         Returns:
             str: The generated session ID if successful, otherwise None.
         """
-        session_id = super().create_session(user_id)
-        if type(session_id) == str:
+        if type(user_id) == str:
+            session_id = str(uuid4())
             kwargs = {
                 'user_id': user_id,
                 'session_id': session_id,
@@ -32,26 +64,41 @@ class SessionDBAuth(SessionExpAuth):
             user_session.save()
             return session_id
 
-    def user_id_for_session_id(self, session_id=None) -> str:
-        """User ID for Session ID
-
-        Retrieves the user ID associated with a given session ID.
+    def session_for_session_id(self, session_id=None) -> UserSession:
+        """Stored Session for Session ID
 
         Returns:
-            str: The user ID associated with the session ID.
+            UserSession: The session if it exists, otherwise None.
         """
+        if type(session_id) is not str:
+            return None
         try:
             sessions = UserSession.search({'session_id': session_id})
         except Exception:
             return None
         if len(sessions) <= 0:
             return None
-        cur_time = datetime.now()
-        time_span = timedelta(seconds=self.session_duration)
-        exp_time = sessions[0].created_at + time_span
-        if exp_time < cur_time:
+        return sessions[0]
+
+    def user_id_for_session_id(self, session_id=None) -> str:
+        """User ID for Session ID
+
+        Retrieves the user ID associated with a given session ID.
+
+        Returns:
+            str: The user ID associated with the session ID.
+        """
+        self.reap()
+        user_session = self.session_for_session_id(session_id)
+        if user_session is None:
             return None
-        return sessions[0].user_id
+        if self.session_duration > 0:
+            # created_at is set with utcnow() by Base
+            time_span = timedelta(seconds=self.session_duration)
+            exp_time = user_session.created_at + time_span
+            if exp_time < datetime.utcnow():
+                return None
+        return user_session.user_id
 
     def destroy_session(self, request=None) -> bool:
         """Destroy Session
@@ -63,11 +110,35 @@ class SessionDBAuth(SessionExpAuth):
             otherwise.
         """
         session_id = self.session_cookie(request)
-        try:
-            sessions = UserSession.search({'session_id': session_id})
-        except Exception:
+        user_session = self.session_for_session_id(session_id)
+        if user_session is None:
             return False
-        if len(sessions) <= 0:
-            return False
-        sessions[0].remove()
+        user_session.remove()
         return True
+
+    def reap(self) -> int:
+        """Remove Expired Stored Sessions
+
+        Runs at most once every SESSION_REAP_INTERVAL seconds, in one
+        request thread at a time, and removes a single batch: the next
+        batch follows at once if this one was full.
+
+        Returns:
+            int: The number of sessions removed.
+        """
+        if self.session_duration <= 0 or time.monotonic() < self.next_reap:
+            return 0
+        if not self.reap_lock.acquire(blocking=False):
+            return 0
+        try:
+            cutoff = datetime.utcnow() - \
+                timedelta(seconds=self.session_duration)
+            expired = UserSession.query([('created_at', '<', cutoff)],
+                                        order_by='created_at',
+                                        limit=self.reap_batch)
+            UserSession.bulk_remove(expired)
+            if len(expired) < self.reap_batch:
+                self.next_reap = time.monotonic() + self.reap_interval
+            return len(expired)
+        finally:
+            self.reap_lock.release()
@@ -3,7 +3,12 @@
 
 Provides session authentication functionality with expiration for the API.
 """
+import heapq
+import itertools
+import math
 import os
+import threading
+import time
 from flask import request
 from datetime import datetime, timedelta
 
@@ -11,15 +16,42 @@ from .session_auth import SessionAuth
 
 
 class SessionExpAuth(SessionAuth):
-    """Session Authentication Class with Expiration"""
+    """Session Authentication Class with Expiration
+
+    Each session records its expiry on the monotonic clock, and a min-heap
+    of `(expires_at, sequence, session_id)` orders the sessions by expiry.
+    Expired sessions are reclaimed as requests come in, in O(expired):
+    `reap` pops the heap while its head is in the past. Sessions that
+    never expire (SESSION_DURATION <= 0) sit at the bottom of the heap in
+    creation order.
+
+    SESSION_MAX_COUNT (default 0: no cap) caps the number of sessions;
+    beyond it the session closest to expiry, i.e. the oldest, is evicted.
+    """
+
+    expiry_heap = []
+    expiry_sequence = itertools.count()
+    sessions_lock = threading.Lock()
+
+    def __init_subclass__(cls, **kwargs) -> None:
+        """Give the subclass its own expiry heap and lock."""
+        super().__init_subclass__(**kwargs)
+        cls.expiry_heap = []
+        cls.expiry_sequence = itertools.count()
+        cls.sessions_lock = threading.Lock()
 
     def __init__(self) -> None:
         """Initialize SessionExpAuth instance."""
-        super().__init__()
         try:
             self.session_duration = int(os.getenv('SESSION_DURATION', '0'))
         except Exception:
             self.session_duration = 0
+        try:
+            self.max_sessions = int(os.getenv('SESSION_MAX_COUNT', '0'))
+        except Exception:
+            self.max_sessions = 0
+        # sessions are restored from the snapshot with the settings above
+        super().__init__()
 
     def create_session(self, user_id=None):
         """Create Session
@@ -32,12 +64,90 @@ class SessionExpAuth(SessionAuth):
         session_id = super().create_session(user_id)
         if type(session_id) != str:
             return None
-        self.user_id_by_session_id[session_id] = {
-            'user_id': user_id,
-            'created_at': datetime.now(),
-        }
+        if self.session_duration > 0:
+            expires_at = time.monotonic() + self.session_duration
+        else:
+            expires_at = math.inf
+        self.reap()
+        with self.sessions_lock:
+            self.user_id_by_session_id[session_id] = {
+                'user_id': user_id,
+                'created_at': datetime.now(),
+                'expires_at': expires_at,
+            }
+            heapq.heappush(self.expiry_heap,
+                           (expires_at, next(self.expiry_sequence),
+                            session_id))
+            self.evict()
         return session_id
 
+    def session_record(self, session_id: str, session) -> list:
+        """Snapshot Fields of a Session
+
+        The monotonic expiry does not survive a restart: the wall clock
+        creation time is saved instead, as a POSIX timestamp.
+
+        Returns:
+            list: The fields to save, None to skip the session.
+        """
+        if type(session) is not dict or 'created_at' not in session:
+            return None
+        return [session_id, session['user_id'],
+                repr(session['created_at'].timestamp())]
+
+    def restore_session(self, fields: list) -> None:
+        """Restore a Session from its Snapshot Fields
+
+        Sessions that expired in the meantime are skipped.
+        """
+        if len(fields) != 3:
+            return
+        session_id, user_id, created = fields
+        try:
+            created = float(created)
+        except ValueError:
+            return
+        expires_at = math.inf
+        if self.session_duration > 0:
+            remaining = created + self.session_duration - time.time()
+            if remaining < 0:
+                return
+            expires_at = time.monotonic() + remaining
+        try:
+            created_at = datetime.fromtimestamp(created)
+        except (ValueError, OverflowError, OSError):
+            return
+        with self.sessions_lock:
+            if session_id in self.user_id_by_session_id:
+                return
+            self.user_id_by_session_id[session_id] = {
+                'user_id': user_id,
+                'created_at': created_at,
+                'expires_at': expires_at,
+            }
+            heapq.heappush(self.expiry_heap,
+                           (expires_at, next(self.expiry_sequence),
+                            session_id))
+            self.evict()
+
+    def session_expired(self, session_dict: dict) -> bool:
+        """Check Session Expiry
+
+        Args:
+            session_dict (dict): The session entry.
+
+        Returns:
+            bool: True if the session expired, False otherwise.
+        """
+        if self.session_duration <= 0:
+            return False
+        if 'expires_at' in session_dict:
+            return session_dict['expires_at'] < time.monotonic()
+        if 'created_at' not in session_dict:
+            return True
+        time_span = timedelta(seconds=self.session_duration)
+        return session_dict['created_at'] + time_span < datetime.now()
+
     def user_id_for_session_id(self, session_id=None) -> str:
         """User ID for Session ID
 
@@ -46,15 +156,67 @@ class SessionExpAuth(SessionAuth):
         Returns:
             str: The user ID associated with the session ID.
         """
-        if session_id in self.user_id_by_session_id:
-            session_dict = self.user_id_by_session_id[session_id]
-            if self.session_duration <= 0:
-                return session_dict['user_id']
-            if 'created_at' not in session_dict:
-                return None
-            cur_time = datetime.now()
-            time_span = timedelta(seconds=self.session_duration)
-            exp_time = session_dict['created_at'] + time_span
-            if exp_time < cur_time:
-                return None
-            return session_dict['user_id']
+        self.reap()
+        session_dict = self.user_id_by_session_id.get(session_id)
+        if type(session_dict) is not dict or \
+                self.session_expired(session_dict):
+            return None
+        return session_dict['user_id']
+
+    def reap(self) -> int:
+        """Remove Expired Sessions
+
+        Costs one comparison when no session expired, otherwise one heap
+        pop per expired (or already destroyed) session.
+
+        Returns:
+            int: The number of sessions removed.
+        """
+        heap = self.expiry_heap
+        if not heap or heap[0][0] >= time.monotonic():
+            return 0
+        removed = 0
+        with self.sessions_lock:
+            now = time.monotonic()
+            while heap and heap[0][0] < now:
+                expires_at, _, session_id = heapq.heappop(heap)
+                if self.discard_session(session_id, expires_at):
+                    removed += 1
+        return removed
+
+    def discard_session(self, session_id: str, expires_at: float) -> bool:
+        """Remove a Session Popped from the Heap
+
+        The session is only removed if it is still the one the heap entry
+        was pushed for: a destroyed session leaves a stale heap entry.
+
+        Returns:
+            bool: True if the session was removed, False otherwise.
+        """
+        session_dict = self.user_id_by_session_id.get(session_id)
+        if type(session_dict) is not dict or \
+                session_dict.get('expires_at') != expires_at:
+            return False
+        del self.user_id_by_session_id[session_id]
+        return True
+
+    def evict(self) -> None:
+        """Enforce SESSION_MAX_COUNT and Drop Stale Heap Entries
+
+        Must be called with `sessions_lock` held.
+        """
+        heap = self.expiry_heap
+        while 0 < self.max_sessions < len(self.user_id_by_session_id) \
+                and heap:
+            expires_at, _, session_id = heapq.heappop(heap)
+            self.discard_session(session_id, expires_at)
+        if len(heap) > 2 * len(self.user_id_by_session_id) + 1024:
+            # destroyed sessions left their entries behind: rebuild
+            heap[:] = [
+                (session_dict['expires_at'], next(self.expiry_sequence),
+                 session_id)
+                for session_id, session_dict in
+                list(self.user_id_by_session_id.items())
+                if type(session_dict) is dict and 'expires_at' in session_dict
+            ]
+            heapq.heapify(heap)
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""Signed Token Session Authentication Module
+
+Provides stateless session authentication for the API: the session
+cookie is a signed token carrying the user ID and the expiry time.
+"""
+import base64
+import hashlib
+import heapq
+import hmac
+import os
+import secrets
+import threading
+import time
+
+from .session_auth import SessionAuth
+
+
+class SessionTokenAuth(SessionAuth):
+    """Signed Token Session Authentication Class
+
+    A session ID is `<user_id>.<expiry>.<nonce>.<signature>`, where the
+    signature is an HMAC-SHA256 of the rest under SESSION_TOKEN_SECRET.
+    Checking it is pure CPU, with no session store lookup. Tokens expire
+    after SESSION_DURATION seconds, or after a day if it is not set.
+
+    Logging out revokes the token's nonce until the token expires. Past
+    SESSION_REVOCATION_MAX (default 100000) revoked tokens, the one
+    expiring first is forgotten and every token expiring no later than
+    it is refused: an overflow logs users out early, it never brings a
+    revoked token back.
+
+    Revocations live in the process that served the logout: with several
+    worker processes, a revoked token is still accepted by the others
+    until it expires. Use session_db_auth where a logout must apply
+    everywhere at once.
+
+    Without SESSION_TOKEN_SECRET, a random secret is drawn at startup.
+    Tokens then do not survive a restart and are not shared between
+    processes.
+    """
+
+    session_snapshot = False
+
+    def __init__(self) -> None:
+        """Initialize SessionTokenAuth instance."""
+        super().__init__()
+        try:
+            self.token_lifetime = int(os.getenv('SESSION_DURATION', '0'))
+        except Exception:
+            self.token_lifetime = 0
+        if self.token_lifetime <= 0:
+            self.token_lifetime = 24 * 60 * 60
+        secret = os.getenv('SESSION_TOKEN_SECRET')
+        if secret:
+            self.token_secret = secret.encode('utf-8')
+        else:
+            self.token_secret = os.urandom(32)
+        try:
+            self.max_revoked = int(os.getenv('SESSION_REVOCATION_MAX',
+                                             '100000'))
+        except Exception:
+            self.max_revoked = 100000
+        # expiry by revoked nonce, and a heap of them, soonest first
+        self.revoked_tokens = {}
+        self.revocation_heap = []
+        # tokens expiring at or before this time are all refused
+        self.revoked_until = 0
+        self.revocation_lock = threading.Lock()
+
+    def sign(self, payload: str) -> str:
+        """Sign a Token Payload
+
+        Args:
+            payload (str): The token without its signature.
+
+        Returns:
+            str: The unpadded URL-safe base64 HMAC-SHA256 of the payload.
+        """
+        digest = hmac.new(self.token_secret, payload.encode('utf-8'),
+                          hashlib.sha256).digest()
+        return base64.urlsafe_b64encode(digest).rstrip(b'=').decode()
+
+    def create_session(self, user_id: str = None) -> str:
+        """Create Session
+
+        Issues a signed token for the user.
+
+        Args:
+            user_id (str): The user ID associated with the session.
+
+        Returns:
+            str: The token, used as session ID.
+        """
+        if type(user_id) is str and '.' not in user_id:
+            payload = '{}.{}.{}'.format(
+                user_id,
+                int(time.time()) + self.token_lifetime,
+                secrets.token_urlsafe(9),
+            )
+            return '{}.{}'.format(payload, self.sign(payload))
+
+    def verify_token(self, session_id: str = None) -> list:
+        """Verify a Token
+
+        Args:
+            session_id (str): The token.
+
+        Returns:
+            list: The user ID, expiry and nonce if the token is authentic
+            and unexpired, otherwise None.
+        """
+        if type(session_id) is not str:
+            return None
+        payload, _, signature = session_id.rpartition('.')
+        fields = payload.split('.')
+        if len(fields) != 3:
+            return None
+        if not hmac.compare_digest(signature.encode('utf-8'),
+                                   self.sign(payload).encode('utf-8')):
+            return None
+        try:
+            expires_at = int(fields[1])
+        except ValueError:
+            return None
+        if expires_at < time.time():
+            return None
+        return fields
+
+    def user_id_for_session_id(self, session_id: str = None) -> str:
+        """User ID for Session ID
+
+        Retrieves the user ID carried by a valid, unrevoked token.
+
+        Args:
+            session_id (str): The token.
+
+        Returns:
+            str: The user ID associated with the token.
+        """
+        fields = self.verify_token(session_id)
+        if fields is None or self.is_revoked(fields):
+            return None
+        return fields[0]
+
+    def is_revoked(self, fields: list) -> bool:
+        """Is a Token Revoked
+
+        Args:
+            fields (list): The fields returned by `verify_token`.
+
+        Returns:
+            bool: True if the token was revoked, or expires no later than
+            a revocation forgotten on overflow.
+        """
+        return int(fields[1]) <= self.revoked_until or \
+            fields[2] in self.revoked_tokens
+
+    def revoke(self, fields: list) -> None:
+        """Revoke a Token Until It Expires
+
+        Expired revocations are dropped first; beyond `max_revoked`, the
+        one expiring first is dropped and `revoked_until` raised to its
+        expiry.
+
+        Args:
+            fields (list): The fields returned by `verify_token`.
+        """
+        expires_at = int(fields[1])
+        now = time.time()
+        with self.revocation_lock:
+            heap = self.revocation_heap
+            while heap and heap[0][0] < now:
+                self.revoked_tokens.pop(heapq.heappop(heap)[1], None)
+            if self.max_revoked <= 0:
+                self.revoked_until = max(self.revoked_until, expires_at)
+                return
+            self.revoked_tokens[fields[2]] = expires_at
+            heapq.heappush(heap, (expires_at, fields[2]))
+            while len(heap) > self.max_revoked:
+                forgotten, nonce = heapq.heappop(heap)
+                self.revoked_tokens.pop(nonce, None)
+                self.revoked_until = max(self.revoked_until, forgotten)
+
+    def destroy_session(self, request=None) -> bool:
+        """Destroy Session
+
+        Revokes the token of the request until it expires.
+
+        Args:
+            request: The Flask request object.
+
+        Returns:
+            bool: True if the token was revoked, False otherwise.
+        """
+        if request is None:
+            return False
+        fields = self.verify_token(self.session_cookie(request))
+        if fields is None or self.is_revoked(fields):
+            return False
+        self.revoke(fields)
+        return True
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Metrics of the API, exported in the Prometheus text format
+"""
+from bisect import bisect_left
+import threading
+from typing import Callable, Dict, List, Tuple
+
+REQUEST_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+AUTH_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001,
+                0.0025, 0.005, 0.01, 0.025, 0.1)
+
+
+def _labels(names: Tuple[str, ...], values: Tuple, extra: str = '') -> str:
+    """Formats a label set, e.g. `{method="GET",status="200"}`.
+    """
+    pairs = [
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\')
+                         .replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in zip(names, values)
+    ]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value: float) -> str:
+    """Formats a sample value.
+    """
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Counter by label values.
+    """
+
+    kind = 'counter'
+
+    def __init__(self, name: str, help: str,
+                 labels: Tuple[str, ...] = ()) -> None:
+        """Initializes a new Counter without any sample.
+        """
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *values, amount: float = 1) -> None:
+        """Adds to the counter of some label values.
+        """
+        with self.lock:
+            self.values[values] = self.values.get(values, 0) + amount
+
+    def samples(self) -> Dict[Tuple, float]:
+        """Returns the counter of each label values.
+        """
+        with self.lock:
+            return dict(self.values)
+
+    def render(self) -> List[str]:
+        """Returns the lines of the counter in the text format.
+        """
+        lines = ['# HELP {} {}'.format(self.name, self.help),
+                 '# TYPE {} {}'.format(self.name, self.kind)]
+        for values, value in sorted(self.samples().items()):
+            lines.append('{}{} {}'.format(
+                self.name, _labels(self.labels, values), _number(value)))
+        return lines
+
+
+class CallbackCounter(Counter):
+    """Counter whose samples are read from a function when rendered.
+    """
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...],
+                 function: Callable[[], Dict[Tuple, float]]) -> None:
+        """Initializes a new CallbackCounter.
+        """
+        super().__init__(name, help, labels)
+        self.function = function
+
+    def samples(self) -> Dict[Tuple, float]:
+        """Returns the counter of each label values, from the function.
+        """
+        return self.function()
+
+
+class Histogram:
+    """Histogram of observed durations by label values.
+
+    An observation costs one bisect and three increments under a lock;
+    buckets only become cumulative when rendered.
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = REQUEST_BUCKETS) -> None:
+        """Initializes a new Histogram without any observation.
+        """
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, *values) -> None:
+        """Records one observation for some label values.
+        """
+        i = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(values)
+            if series is None:
+                # counts by bucket, then the +Inf bucket, then the sum
+                series = self.series[values] = \
+                    [0] * (len(self.buckets) + 1) + [0.0]
+            series[i] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        """Returns the lines of the histogram in the text format.
+        """
+        with self.lock:
+            series = {values: list(s) for values, s in self.series.items()}
+        lines = ['# HELP {} {}'.format(self.name, self.help),
+                 '# TYPE {} {}'.format(self.name, self.kind)]
+        for values, counts in sorted(series.items()):
+            total = 0
+            bounds = [repr(float(b)) for b in self.buckets] + ['+Inf']
+            for bound, count in zip(bounds, counts):
+                total += count
+                lines.append('{}_bucket{} {}'.format(
+                    self.name,
+                    _labels(self.labels, values, 'le="{}"'.format(bound)),
+                    total))
+            labels = _labels(self.labels, values)
+            lines.append('{}_sum{} {}'.format(self.name, labels,
+                                              repr(counts[-1])))
+            lines.append('{}_count{} {}'.format(self.name, labels, total))
+        return lines
+
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds',
+    'Time from the start of a request to its response, by route.',
+    ('method', 'route'))
+REQUEST_COUNT = Counter(
+    'http_requests_total',
+    'Responses sent, by route and status code.',
+    ('method', 'route', 'status'))
+AUTH_LATENCY = Histogram(
+    'auth_current_user_duration_seconds',
+    'Time to resolve the user of a request, by authentication type.',
+    ('auth_type', 'outcome'), AUTH_BUCKETS)
+REGISTRY = [REQUEST_LATENCY, REQUEST_COUNT, AUTH_LATENCY]
+
+
+def render(metrics: List = None) -> str:
+    """Returns metrics (by default, those of `REGISTRY`) in the Prometheus
+    text format, version 0.0.4.
+    """
+    lines = []
+    for metric in REGISTRY if metrics is None else metrics:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
@@ -1,7 +1,8 @@
 #!/usr/bin/env python3
 """ Module of Index views
 """
-from flask import jsonify, abort
+from flask import Response, jsonify, abort
+from api.v1.metrics import render
 from api.v1.views import app_views
 
 
@@ -26,6 +27,18 @@ def stats() -> str:
     return jsonify(stats)
 
 
+@app_views.route('/metrics', methods=['GET'], strict_slashes=False)
+def metrics() -> str:
+    """ GET /api/v1/metrics
+    Return:
+      - request latencies and statuses by route, `current_user` timings
+        by authentication type and auth cache lookups, in the Prometheus
+        text format
+    """
+    return Response(render(),
+                    content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 @app_views.route('/unauthorized', methods=['GET'], strict_slashes=False)
 def unauthorized() -> str:
     """Get Unauthorized Status
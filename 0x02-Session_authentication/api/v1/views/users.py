@@ -1,19 +1,120 @@
 #!/usr/bin/env python3
 """ Module of Users views
 """
+import hashlib
+from os import getenv
+from api.v1.auth.cache import TTLCache
 from api.v1.views import app_views
-from flask import abort, jsonify, request
+from flask import Response, abort, jsonify, request, stream_with_context
 from models.user import User
 
+MAX_PAGE_SIZE = 1000
+# list ETags and pages, valid while User.revision() does not move
+RESPONSES = TTLCache(int(getenv('RESPONSE_CACHE_SIZE', '1024')),
+                     float(getenv('RESPONSE_CACHE_TTL', '300')))
+
+
+def _etag(texts, *parts) -> str:
+    """ Strong ETag of a representation: a digest of the JSON `texts` of
+    its objects, as sent, and of the extra `parts`
+
+    Built from the content rather than `updated_at`, which only keeps
+    whole seconds once an object is read back from its serialized form.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        digest.update('{}\n'.format(part).encode())
+    for text in texts:
+        digest.update(text.encode())
+        digest.update(b'\n')
+    return digest.hexdigest()
+
+
+def _not_modified(etag: str) -> bool:
+    """ Whether `If-None-Match` of the request matches `etag`
+    """
+    return request.if_none_match.contains_weak(etag)
+
+
+def _tagged(response: Response, etag: str) -> Response:
+    """ Set the ETag of a response
+    """
+    response.set_etag(etag)
+    return response
+
+
+def _json_chunks(objs):
+    """ Yield a JSON array of `objs`, one object serialized at a time
+    """
+    yield '['
+    for i, obj in enumerate(objs):
+        yield (',' if i else '') + obj.to_json_text()
+    yield ']\n'
+
+
+def _json_array(objs) -> Response:
+    """ Stream a JSON array of `objs`, one object serialized at a time
+    """
+    return Response(stream_with_context(_json_chunks(objs)),
+                    mimetype='application/json')
+
 
 @app_views.route('/users', methods=['GET'], strict_slashes=False)
 def view_all_users() -> str:
     """ GET /api/v1/users
+    Query parameters (optional):
+      - limit: page size, at most 1000
+      - after: cursor, the `X-Next-Cursor` of the previous page
     Return:
-      - list of all User objects JSON represented
+      - list of all User objects JSON represented, or one page of them
+        ordered by ID when `limit` or `after` is given; the header
+        `X-Next-Cursor` is set when another page follows
+      - 304 if `If-None-Match` has the ETag of the list or page
+      - 400 if `limit` isn't a positive integer
     """
-    all_users = [user.to_json() for user in User.all()]
-    return jsonify(all_users)
+    limit = request.args.get('limit')
+    after = request.args.get('after')
+    # read before the users: a racing write can only tag a body with an
+    # older ETag than its content, which the next request corrects
+    revision = User.revision()
+    if limit is None and after is None:
+        # only the ETag is cached, the body (possibly huge) is streamed
+        entry = RESPONSES.get(('users',), lambda e: e[0] == revision)
+        users = None
+        if entry is None:
+            users = User.all()
+            entry = (revision, _etag(user.to_json_text() for user in users))
+            RESPONSES.set(('users',), entry)
+        etag = entry[1]
+        if _not_modified(etag):
+            return _tagged(Response(status=304), etag)
+        return _tagged(_json_array(User.all() if users is None else users),
+                       etag)
+    try:
+        limit = MAX_PAGE_SIZE if limit is None else int(limit)
+    except ValueError:
+        limit = 0
+    if limit <= 0:
+        return jsonify({'error': "limit must be a positive integer"}), 400
+    limit = min(limit, MAX_PAGE_SIZE)
+    key = ('users', limit, after)
+    entry = RESPONSES.get(key, lambda e: e[0] == revision)
+    if entry is None:
+        users = User.page(limit + 1, after)
+        cursor = users[limit - 1].id if len(users) > limit else None
+        texts = [user.to_json_text() for user in users[:limit]]
+        etag = _etag(texts, cursor)
+        body = ('[' + ','.join(texts) + ']\n').encode()
+        entry = (revision, etag, body, cursor)
+        RESPONSES.set(key, entry)
+    revision, etag, body, cursor = entry
+    if _not_modified(etag):
+        response = Response(status=304)
+    else:
+        response = Response(body, mimetype='application/json')
+    if cursor is not None:
+        response.headers['X-Next-Cursor'] = cursor
+    return _tagged(response, etag)
 
 
 @app_views.route('/users/<user_id>', methods=['GET'], strict_slashes=False)
@@ -22,20 +123,25 @@ def view_one_user(user_id: str = None) -> str:
     Path parameter:
       - User ID
     Return:
-      - User object JSON represented
+      - User object JSON represented, with its ETag
+      - 304 if `If-None-Match` has that ETag
       - 404 if the User ID doesn't exist
     """
     if user_id is None:
         abort(404)
     if user_id == 'me':
-        if request.current_user is None:
-            abort(404)
-        else:
-            return jsonify(request.current_user.to_json())
-    user = User.get(user_id)
+        user = request.current_user
+    else:
+        user = User.get(user_id)
     if user is None:
         abort(404)
-    return jsonify(user.to_json())
+    # tag and body come from the same text, memoized by the object
+    text = user.to_json_text()
+    etag = _etag([text])
+    if _not_modified(etag):
+        return _tagged(Response(status=304), etag)
+    return _tagged(Response(text + '\n', mimetype='application/json'),
+                   etag)
 
 
 @app_views.route('/users/<user_id>', methods=['DELETE'], strict_slashes=False)
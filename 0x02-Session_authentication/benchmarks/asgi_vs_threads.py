@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+""" Benchmark of the ASGI entry point against thread-per-client serving
+
+Usage: python3 -m benchmarks.asgi_vs_threads [--server] [clients] [requests]
+
+Runs in a temporary directory with AUTH_TYPE=session_auth unless set.
+`clients` concurrent clients (default 256) send `requests` requests in
+total (default 20000): half GET /api/v1/users/me with a valid session,
+a quarter with an unknown session cookie (403), a quarter POST
+/api/v1/users (one journal write each). Prints throughput, p50 / p99
+latency and the peak number of threads.
+
+By default both servers run in-process, the same WSGI environ going
+either to the Flask app on one thread per client, like the threaded
+development server, or to `api.v1.asgi.AsyncApp` from one event loop;
+sockets and HTTP parsing are left out of both. With `--server`, the
+clients are coroutines sending HTTP requests to real servers started on
+the seeded store: `app.run(threaded=True)`, then `api.v1.asgi` under
+uvicorn when it is installed.
+"""
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+os.chdir(tempfile.mkdtemp())
+os.environ.setdefault('AUTH_TYPE', 'session_auth')
+os.environ.setdefault('SESSION_NAME', '_my_session_id')
+
+from api.v1.app import app, auth  # noqa: E402
+from api.v1.asgi import AsyncApp, wsgi_environ  # noqa: E402
+from models.user import User  # noqa: E402
+
+PORT = 5056
+SERVERS = {
+    'threads': "import os; from api.v1.app import app; "
+               "app.run('127.0.0.1', int(os.environ['API_PORT']), "
+               "threaded=True)",
+    'asgi': "import os, uvicorn; "
+            "uvicorn.run('api.v1.asgi:application', host='127.0.0.1', "
+            "port=int(os.environ['API_PORT']), log_level='warning')",
+}
+
+
+def workload(requests: int, session_id: str, name: str) -> list:
+    """ The ASGI scopes, bodies and expected statuses of the requests, in
+    sending order
+    """
+    cookie = os.environ['SESSION_NAME'].encode() + b'='
+    scopes = []
+    for i in range(requests):
+        scope = {'type': 'http', 'method': 'GET', 'http_version': '1.1',
+                 'path': '/api/v1/users/me', 'query_string': b'',
+                 'headers': [(b'cookie', cookie + session_id.encode())]}
+        body = b''
+        status = 200
+        if i % 4 == 1:
+            scope['headers'] = [(b'cookie', cookie + b'unknown')]
+            status = 403
+        elif i % 4 == 3:
+            scope['method'] = 'POST'
+            scope['path'] = '/api/v1/users'
+            scope['headers'].append((b'content-type', b'application/json'))
+            body = json.dumps({'email': '{}{}@hbtn.io'.format(name, i),
+                               'password': 'pwd'}).encode()
+            status = 201
+        scopes.append((scope, body, status))
+    return scopes
+
+
+def report(name: str, latencies: list, seconds: float, threads: int,
+           errors: int):
+    """ Print throughput, latency percentiles and peak threads
+    """
+    if errors:
+        print("{}: {} unexpected statuses".format(name, errors))
+    latencies.sort()
+    print("{:<8} {:>8.0f} req/s  p50 {:>7.2f} ms  p99 {:>7.2f} ms  "
+          "{} threads".format(
+              name, len(latencies) / seconds,
+              latencies[len(latencies) // 2] * 1e3,
+              latencies[int(len(latencies) * 0.99)] * 1e3, threads))
+
+
+def run_threads(clients: int, scopes: list) -> None:
+    """ One thread per client calls the Flask app
+    """
+    runner = AsyncApp(app, auth, workers=1)
+    latencies = []
+    errors = []
+    peak = [threading.active_count()]
+
+    def client(n: int):
+        for scope, body, expected in scopes[n::clients]:
+            start = time.perf_counter()
+            status = runner.call_wsgi(wsgi_environ(scope, body))[0]
+            latencies.append(time.perf_counter() - start)
+            if status != expected:
+                errors.append(status)
+        peak[0] = max(peak[0], threading.active_count())
+
+    threads = [threading.Thread(target=client, args=(n,))
+               for n in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    report('threads', latencies, time.perf_counter() - start, peak[0],
+           len(errors))
+
+
+def run_asgi(clients: int, scopes: list) -> None:
+    """ One coroutine per client calls the ASGI app
+    """
+    application = AsyncApp(app, auth)
+    latencies = []
+    errors = []
+
+    async def client(n: int):
+        for scope, body, expected in scopes[n::clients]:
+            messages = [{'type': 'http.request', 'body': body}]
+            sent = []
+
+            async def receive():
+                return messages.pop()
+
+            async def send(message):
+                sent.append(message)
+
+            start = time.perf_counter()
+            await application(scope, receive, send)
+            latencies.append(time.perf_counter() - start)
+            if sent[0]['status'] != expected:
+                errors.append(sent[0]['status'])
+
+    async def main():
+        await asyncio.gather(*(client(n) for n in range(clients)))
+
+    start = time.perf_counter()
+    asyncio.run(main())
+    report('asgi', latencies, time.perf_counter() - start,
+           threading.active_count(), len(errors))
+    application.executor.shutdown()
+
+
+def server_threads(pid: int) -> int:
+    """ Number of threads of the process `pid` (Linux), or 0
+    """
+    try:
+        with open('/proc/{}/status'.format(pid)) as f:
+            for line in f:
+                if line.startswith('Threads:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+async def http_request(connection: list, scope: dict, body: bytes) -> int:
+    """ Send a request over the kept-alive `[reader, writer]` connection,
+    (re)opening it when the server closed it; return the status code
+    """
+    head = ['{} {} HTTP/1.1'.format(scope['method'], scope['path']),
+            'Host: 127.0.0.1:{}'.format(PORT),
+            'Content-Length: {}'.format(len(body))]
+    head.extend('{}: {}'.format(k.decode(), v.decode())
+                for k, v in scope['headers'])
+    request = ('\r\n'.join(head) + '\r\n\r\n').encode() + body
+    if connection[1] is None:
+        connection[:] = await asyncio.open_connection('127.0.0.1', PORT)
+    reader, writer = connection
+    writer.write(request)
+    lines = (await reader.readuntil(b'\r\n\r\n')).decode().split('\r\n')
+    version, status = lines[0].split(' ')[:2]
+    headers = dict(line.lower().split(': ', 1) for line in lines[1:] if line)
+    if 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    else:
+        await reader.read()
+    if version == 'HTTP/1.0' or headers.get('connection') == 'close' or \
+            'content-length' not in headers:
+        writer.close()
+        connection[:] = [None, None]
+    return int(status)
+
+
+def run_server(name: str, clients: int, scopes: list) -> None:
+    """ Start the `name` server on the store, then one coroutine per
+    client sends it HTTP requests
+    """
+    if name == 'asgi':
+        try:
+            import uvicorn  # noqa: F401
+        except ImportError:
+            print("asgi: uvicorn is not installed, skipped")
+            return
+    if hasattr(auth, 'save_sessions'):
+        auth.save_sessions()
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, API_PORT=str(PORT),
+               SESSION_SNAPSHOT_INTERVAL='3600',
+               PYTHONPATH=os.pathsep.join(
+                   p for p in (root, os.environ.get('PYTHONPATH')) if p))
+    server = subprocess.Popen([sys.executable, '-c', SERVERS[name]],
+                              env=env, stdout=subprocess.DEVNULL,
+                              stderr=subprocess.DEVNULL)
+    latencies = []
+    errors = []
+    peak = [0]
+
+    async def client(n: int):
+        connection = [None, None]
+        for scope, body, expected in scopes[n::clients]:
+            start = time.perf_counter()
+            try:
+                status = await http_request(connection, scope, body)
+            except (OSError, asyncio.IncompleteReadError):
+                connection[:] = [None, None]
+                status = await http_request(connection, scope, body)
+            latencies.append(time.perf_counter() - start)
+            if status != expected:
+                errors.append(status)
+        if connection[1] is not None:
+            connection[1].close()
+
+    async def sample():
+        while True:
+            peak[0] = max(peak[0], server_threads(server.pid))
+            await asyncio.sleep(0.05)
+
+    async def main():
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                status = await http_request(
+                    [None, None], {'method': 'GET', 'headers': [],
+                                   'path': '/api/v1/status'}, b'')
+                if status == 200:
+                    break
+            except OSError:
+                pass
+            if time.monotonic() > deadline or server.poll() is not None:
+                raise SystemExit("{} server did not start".format(name))
+            await asyncio.sleep(0.2)
+        sampler = asyncio.ensure_future(sample())
+        start = time.perf_counter()
+        await asyncio.gather(*(client(n) for n in range(clients)))
+        seconds = time.perf_counter() - start
+        sampler.cancel()
+        return seconds
+
+    try:
+        seconds = asyncio.run(main())
+    finally:
+        server.terminate()
+        server.wait()
+    report(name, latencies, seconds, peak[0], len(errors))
+
+
+if __name__ == "__main__":
+    args = [arg for arg in sys.argv[1:] if arg != '--server']
+    clients = int(args[0]) if len(args) > 0 else 256
+    requests = int(args[1]) if len(args) > 1 else 20000
+
+    admin = User(email="admin@hbtn.io")
+    admin.password = "admin"
+    admin.save()
+    session_id = auth.create_session(admin.id)
+    print("{} clients, {} requests, AUTH_TYPE={}".format(
+        clients, requests, os.environ['AUTH_TYPE']))
+    if '--server' in sys.argv[1:]:
+        for name in SERVERS:
+            run_server(name, clients, workload(requests, session_id, name))
+        sys.exit()
+    run_threads(clients, workload(requests, session_id, 'threads'))
+    auth.failure_cache.clear()
+    run_asgi(clients, workload(requests, session_id, 'asgi'))
@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+""" Load test of the API across authentication types
+
+Usage: python3 -m benchmarks.load_test [options]  (see --help)
+
+Each AUTH_TYPE runs in its own process and temporary directory: a store
+of `--users` users and `--sessions` sessions is seeded, then `--clients`
+concurrent clients send `--requests` requests in total, through Flask's
+test client or, with `--server`, to a local development server of
+`api.v1.app` started on the seeded store. Each client loops over: login, eight
+GET /api/v1/users/me, two GET /api/v1/users?limit=100, one
+POST /api/v1/users, logout. `basic_auth` sends an Authorization header
+instead of logging in and out; `auth` sends no credential at all.
+
+Throughput and p50 / p95 / p99 latency per route are written as JSON to
+`--output` (default `load_test.json`), keys sorted so that two runs can
+be diffed.
+"""
+import argparse
+import base64
+import http.client
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+AUTH_TYPES = ('auth', 'basic_auth', 'session_auth', 'session_exp_auth',
+              'session_db_auth', 'session_token_auth')
+PASSWORD = 'pwd'
+SEED_BATCH = 10000
+LOGIN = ('POST', '/api/v1/auth_session/login')
+ME = ('GET', '/api/v1/users/me')
+LIST = ('GET', '/api/v1/users?limit=100')
+CREATE = ('POST', '/api/v1/users')
+LOGOUT = ('DELETE', '/api/v1/auth_session/logout')
+CYCLE = [ME, ME, LIST, ME, ME, CREATE, ME, ME, LIST, ME, ME]
+SERVER = ("import os; from api.v1.app import app; "
+          "app.run(os.environ['API_HOST'], int(os.environ['API_PORT']), "
+          "threaded=True)")
+
+
+def email(i: int) -> str:
+    """ Email of the seeded user `i`
+    """
+    return 'user{}@load.test'.format(i)
+
+
+def seed(users: int, sessions: int) -> dict:
+    """ Create the users and sessions, return their counts and duration
+    """
+    from api.v1.app import auth
+    from api.v1.auth.session_auth import SessionAuth
+    from api.v1.auth.session_db_auth import SessionDBAuth
+    from api.v1.auth.session_token_auth import SessionTokenAuth
+    from models.base import flush
+    from models.user import User
+    from models.user_session import UserSession
+
+    start = time.perf_counter()
+    hashed = User()
+    hashed.password = PASSWORD
+    user_ids = []
+    for first in range(0, users, SEED_BATCH):
+        batch = [
+            {'id': str(uuid.uuid4()), 'email': email(i),
+             '_password': hashed.password}
+            for i in range(first, min(users, first + SEED_BATCH))
+        ]
+        User.bulk_create(batch)
+        user_ids.extend(record['id'] for record in batch)
+    seeded_sessions = 0
+    if isinstance(auth, SessionDBAuth):
+        for first in range(0, sessions, SEED_BATCH):
+            UserSession.bulk_create([
+                {'user_id': user_ids[i % users],
+                 'session_id': str(uuid.uuid4())}
+                for i in range(first, min(sessions, first + SEED_BATCH))
+            ])
+        seeded_sessions = sessions
+    elif isinstance(auth, SessionAuth) and \
+            not isinstance(auth, SessionTokenAuth):
+        for i in range(sessions):
+            auth.create_session(user_ids[i % users])
+        seeded_sessions = sessions
+    flush()
+    return {'users': users, 'sessions': seeded_sessions,
+            'seconds': round(time.perf_counter() - start, 3)}
+
+
+class TestClient:
+    """ Requests through Flask's test client, in-process
+    """
+
+    def __init__(self):
+        """ Initialize a client with an empty cookie jar
+        """
+        from api.v1.app import app
+        self.client = app.test_client()
+
+    def request(self, method: str, path: str, headers: dict,
+                form: dict = None, body: dict = None) -> int:
+        """ Send a request, return its status code
+        """
+        response = self.client.open(path, method=method, headers=headers,
+                                    data=form, json=body)
+        response.get_data()
+        return response.status_code
+
+
+class HTTPClient:
+    """ Requests to a local server over one kept-alive connection
+    """
+
+    def __init__(self, port: int):
+        """ Initialize a client with an empty cookie jar
+        """
+        self.connection = http.client.HTTPConnection('127.0.0.1', port)
+        self.cookies = {}
+
+    def request(self, method: str, path: str, headers: dict,
+                form: dict = None, body: dict = None) -> int:
+        """ Send a request, return its status code
+        """
+        headers = dict(headers)
+        data = None
+        if form is not None:
+            data = '&'.join('{}={}'.format(k, v) for k, v in form.items())
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        elif body is not None:
+            data = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        if self.cookies:
+            headers['Cookie'] = '; '.join(
+                '{}={}'.format(k, v) for k, v in self.cookies.items())
+        try:
+            self.connection.request(method, path, data, headers)
+            response = self.connection.getresponse()
+        except (http.client.HTTPException, OSError):
+            # the development server may close kept-alive connections
+            self.connection.close()
+            self.connection.request(method, path, data, headers)
+            response = self.connection.getresponse()
+        response.read()
+        for value in response.headers.get_all('Set-Cookie') or []:
+            name, _, cookie = value.split(';', 1)[0].partition('=')
+            self.cookies[name.strip()] = cookie
+        if response.getheader('Connection', '').lower() == 'close':
+            self.connection.close()
+        return response.status
+
+
+def client_loop(n: int, client, auth_type: str, requests: int,
+                users: int, latencies: dict, errors: dict):
+    """ Run the workload of client `n` until it sent `requests` requests
+    """
+    user_email = email(n % users)
+    headers = {}
+    protected = 200
+    sessions = auth_type not in ('auth', 'basic_auth')
+    if auth_type == 'basic_auth':
+        token = '{}:{}'.format(user_email, PASSWORD).encode()
+        headers['Authorization'] = 'Basic ' + base64.b64encode(token).decode()
+    elif auth_type == 'auth':
+        protected = 401
+    sent = 0
+    created = 0
+    while sent < requests:
+        steps = ([LOGIN] if sessions else []) + CYCLE + \
+            ([LOGOUT] if sessions else [])
+        for route in steps[:requests - sent]:
+            form = body = None
+            expected = protected
+            if route == LOGIN:
+                form = {'email': user_email, 'password': PASSWORD}
+                expected = 200
+            elif route == CREATE:
+                body = {'email': 'new{}-{}@load.test'.format(n, created),
+                        'password': PASSWORD}
+                created += 1
+                expected = 201 if protected == 200 else protected
+            start = time.perf_counter()
+            status = client.request(route[0], route[1], headers, form, body)
+            latencies[route].append(time.perf_counter() - start)
+            if status != expected:
+                errors[route] = errors.get(route, 0) + 1
+            sent += 1
+
+
+def percentile(samples: list, q: float) -> float:
+    """ Nearest-rank percentile of sorted samples, in milliseconds
+    """
+    if not samples:
+        return None
+    return round(samples[min(len(samples) - 1, int(q * len(samples)))] * 1e3,
+                 3)
+
+
+def run(auth_type: str, options) -> dict:
+    """ Seed the store and drive the workload for the current AUTH_TYPE
+    """
+    result = {'seed': seed(options.users, options.sessions)}
+    server = None
+    if options.server:
+        from api.v1.app import auth
+        if hasattr(auth, 'save_sessions'):
+            auth.save_sessions()
+        env = dict(os.environ, API_HOST='127.0.0.1',
+                   API_PORT=str(options.port),
+                   SESSION_SNAPSHOT_INTERVAL='3600')
+        # imported, not run as __main__: the views import `api.v1.app`
+        # and would otherwise build a second app, reloading the stores
+        server = subprocess.Popen([sys.executable, '-c', SERVER],
+                                  env=env, stdout=subprocess.DEVNULL,
+                                  stderr=subprocess.DEVNULL)
+        deadline = time.monotonic() + options.startup_timeout
+        while True:
+            try:
+                if HTTPClient(options.port).request(
+                        'GET', '/api/v1/status', {}) == 200:
+                    break
+            except OSError:
+                pass
+            if time.monotonic() > deadline or server.poll() is not None:
+                server.kill()
+                raise SystemExit("server did not start")
+            time.sleep(0.2)
+
+    routes = [LOGIN, ME, LIST, CREATE, LOGOUT]
+    per_client = [({route: [] for route in routes}, {})
+                  for n in range(options.clients)]
+    threads = []
+    for n in range(options.clients):
+        client = HTTPClient(options.port) if options.server else TestClient()
+        requests = options.requests // options.clients + \
+            (1 if n < options.requests % options.clients else 0)
+        threads.append(threading.Thread(target=client_loop, args=(
+            n, client, auth_type, requests, options.users) +
+            per_client[n]))
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - start
+    if server is not None:
+        server.terminate()
+        server.wait()
+
+    result['seconds'] = round(seconds, 3)
+    result['requests'] = sum(len(samples) for latencies, _ in per_client
+                             for samples in latencies.values())
+    result['throughput'] = round(result['requests'] / seconds, 1)
+    result['routes'] = {}
+    for route in routes:
+        samples = sorted(s for latencies, _ in per_client
+                         for s in latencies[route])
+        if not samples:
+            continue
+        result['routes'][' '.join(route)] = {
+            'requests': len(samples),
+            'errors': sum(errors.get(route, 0) for _, errors in per_client),
+            'throughput': round(len(samples) / seconds, 1),
+            'p50_ms': percentile(samples, 0.50),
+            'p95_ms': percentile(samples, 0.95),
+            'p99_ms': percentile(samples, 0.99),
+        }
+    return result
+
+
+def parse_arguments(argv: list):
+    """ Parse the command line
+    """
+    parser = argparse.ArgumentParser(
+        prog='python3 -m benchmarks.load_test',
+        description="Load test of the API across authentication types.")
+    parser.add_argument('--auth-types', default=','.join(AUTH_TYPES),
+                        help="comma-separated AUTH_TYPEs (default: all)")
+    parser.add_argument('--users', type=int, default=1000,
+                        help="users seeded (default 1000)")
+    parser.add_argument('--sessions', type=int, default=1000,
+                        help="sessions seeded (default 1000)")
+    parser.add_argument('--clients', type=int, default=16,
+                        help="concurrent clients (default 16)")
+    parser.add_argument('--requests', type=int, default=5000,
+                        help="requests per AUTH_TYPE (default 5000)")
+    parser.add_argument('--server', action='store_true',
+                        help="run against a local server, not in-process")
+    parser.add_argument('--port', type=int, default=5055,
+                        help="port of the local server (default 5055)")
+    parser.add_argument('--startup-timeout', type=float, default=600,
+                        help="seconds to wait for the server (default 600)")
+    parser.add_argument('--output', default='load_test.json',
+                        help="result file (default load_test.json)")
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    options = parser.parse_args(argv)
+    if options.users < max(1, options.clients):
+        parser.error("--users must be at least --clients")
+    return options
+
+
+if __name__ == "__main__":
+    options = parse_arguments(sys.argv[1:])
+    if options.child:
+        print(json.dumps(run(options.child, options)))
+        sys.exit(0)
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    report = {
+        'config': {k: v for k, v in vars(options).items()
+                   if k not in ('child', 'output', 'startup_timeout')},
+        'results': {},
+    }
+    for auth_type in options.auth_types.split(','):
+        env = dict(os.environ, AUTH_TYPE=auth_type,
+                   PYTHONPATH=os.pathsep.join(
+                       p for p in (root, os.environ.get('PYTHONPATH')) if p))
+        env.setdefault('SESSION_NAME', '_my_session_id')
+        # snapshots are taken explicitly before a server starts
+        env['SESSION_SNAPSHOT_INTERVAL'] = '0'
+        child = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.load_test',
+             '--child', auth_type] + sys.argv[1:],
+            cwd=tempfile.mkdtemp(), env=env, stdout=subprocess.PIPE)
+        if child.returncode != 0:
+            print("{}: failed".format(auth_type), file=sys.stderr)
+            continue
+        result = json.loads(child.stdout.decode().splitlines()[-1])
+        report['results'][auth_type] = result
+        print("{}: {} req/s".format(auth_type, result['throughput']))
+        for route, stats in result['routes'].items():
+            print("  {:<32} p50 {:>8} ms  p95 {:>8} ms  p99 {:>8} ms{}".format(
+                route, stats['p50_ms'], stats['p95_ms'], stats['p99_ms'],
+                "  {} errors".format(stats['errors']) if stats['errors']
+                else ''))
+    with open(options.output, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+        f.write('\n')
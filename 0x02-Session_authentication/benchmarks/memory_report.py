@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+""" Memory report of the in-memory store
+
+Usage: python3 -m benchmarks.memory_report [count]
+
+Builds `count` User objects and `count` UserSession objects (10 sessions
+per user) the way the API does, and prints the memory they retain in
+DATA, per object.
+"""
+import gc
+import json
+import sys
+import tracemalloc
+from uuid import uuid4
+
+from models.json_storage import DATA
+from models.user import User
+from models.user_session import UserSession
+
+
+def measure(build) -> int:
+    """ Return the bytes still allocated after `build()` returns
+    """
+    gc.collect()
+    tracemalloc.start()
+    build()
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size
+
+
+def build_users(count: int, user_ids: list):
+    """ Store `count` users and keep their IDs
+    """
+    DATA['User'] = {}
+    for i in range(count):
+        user = User(email="user{}@hbtn.io".format(i), first_name="Bob")
+        user.password = "H0lbertonSchool98!"
+        DATA['User'][user.id] = user
+        user_ids.append(user.id)
+
+
+def build_sessions(count: int, user_ids: list):
+    """ Store `count` sessions spread over `user_ids`
+    """
+    DATA['UserSession'] = {}
+    for i in range(count):
+        # a fresh string, as when it comes out of a request or a file
+        user_id = json.loads(json.dumps(user_ids[(i // 10) % len(user_ids)]))
+        session = UserSession(user_id=user_id, session_id=str(uuid4()))
+        DATA['UserSession'][session.id] = session
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    user_ids = []
+    users_size = measure(lambda: build_users(count, user_ids))
+    sessions_size = measure(lambda: build_sessions(count, user_ids))
+    print("User:        {:>6} bytes/object".format(users_size // count))
+    print("UserSession: {:>6} bytes/object".format(sessions_size // count))
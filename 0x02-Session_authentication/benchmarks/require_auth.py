@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+""" Micro-benchmark of Auth.require_auth
+
+Usage: python3 -m benchmarks.require_auth [rules] [iterations]
+
+Times one call with `rules` excluded paths (default 50) for a path that
+matches none of them, the worst case, against the previous
+implementation which built and matched one regex per excluded path.
+"""
+import re
+import sys
+import timeit
+
+from api.v1.auth.auth import Auth
+
+
+def legacy_require_auth(path: str, excluded_paths: list) -> bool:
+    """ Previous Auth.require_auth, kept for comparison
+    """
+    if path is not None and excluded_paths is not None:
+        for exclusion_path in map(lambda x: x.strip(), excluded_paths):
+            pattern = ''
+            if exclusion_path[-1] == '*':
+                pattern = '{}.*'.format(exclusion_path[0:-1])
+            elif exclusion_path[-1] == '/':
+                pattern = '{}/*'.format(exclusion_path[0:-1])
+            else:
+                pattern = '{}/*'.format(exclusion_path)
+            if re.match(pattern, path):
+                return False
+    return True
+
+
+if __name__ == "__main__":
+    rules = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+    suffixes = ('/', '*', '')
+    excluded_paths = [
+        '/api/v1/excluded{}{}'.format(i, suffixes[i % 3])
+        for i in range(rules)
+    ]
+    paths = ['/api/v1/users/me', '/api/v1/excluded7/x', '/api/v1/excluded',
+             '/api/v1/excluded8', '/api/v1/excluded90']
+    auth = Auth()
+    for path in paths:
+        assert auth.require_auth(path, excluded_paths) == \
+            legacy_require_auth(path, excluded_paths), path
+
+    path = '/api/v1/users/me'
+    for name, function in (('legacy', legacy_require_auth),
+                           ('prefixes', auth.require_auth)):
+        seconds = timeit.timeit(lambda: function(path, excluded_paths),
+                                number=iterations)
+        print("{:<10} {} rules: {:.2f} us/call".format(
+            name, rules, seconds / iterations * 1e6))
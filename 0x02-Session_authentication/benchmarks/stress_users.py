@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+""" Concurrency stress test of the users endpoints
+
+Usage: python3 -m benchmarks.stress_users [threads] [iterations]
+
+Runs in a temporary directory with AUTH_TYPE=basic_auth. Every thread
+loops over POST, GET, PUT, GET /users and DELETE /api/v1/users while the
+others do the same, then the store is reloaded from disk and compared
+with memory. Exits with status 1 on any unexpected status code, exception
+or mismatch.
+"""
+import base64
+import os
+import sys
+import tempfile
+import threading
+
+os.chdir(tempfile.mkdtemp())
+os.environ['AUTH_TYPE'] = 'basic_auth'
+
+from api.v1.app import app  # noqa: E402
+from models.base import flush  # noqa: E402
+from models.user import User  # noqa: E402
+
+
+def worker(n: int, iterations: int, headers: dict, failures: list):
+    """ Run the create/read/update/list/delete cycle `iterations` times
+    """
+    client = app.test_client()
+    expected = [
+        ('POST', 201), ('GET', 200), ('PUT', 200), ('LIST', 200),
+        ('DELETE', 200),
+    ]
+    try:
+        for i in range(iterations):
+            email = "stress{}-{}@hbtn.io".format(n, i)
+            res = client.post('/api/v1/users', headers=headers,
+                              json={'email': email, 'password': 'pwd'})
+            statuses = [res.status_code]
+            user_id = (res.get_json() or {}).get('id')
+            url = '/api/v1/users/{}'.format(user_id)
+            statuses.append(client.get(url, headers=headers).status_code)
+            statuses.append(client.put(url, headers=headers,
+                                       json={'first_name': 'F'}).status_code)
+            statuses.append(client.get('/api/v1/users',
+                                       headers=headers).status_code)
+            if i % 2 == 0:
+                statuses.append(client.delete(url,
+                                              headers=headers).status_code)
+            for (action, code), status in zip(expected, statuses):
+                if code != status:
+                    failures.append("{} {} -> {}".format(action, url, status))
+    except Exception as e:
+        failures.append(repr(e))
+
+
+if __name__ == "__main__":
+    threads_count = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    sys.setswitchinterval(1e-5)
+
+    User.load_from_file()
+    admin = User(email="admin@hbtn.io")
+    admin.password = "admin"
+    admin.save()
+    token = base64.b64encode(b"admin@hbtn.io:admin").decode()
+    headers = {'Authorization': 'Basic {}'.format(token)}
+
+    failures = []
+    threads = [
+        threading.Thread(target=worker,
+                         args=(n, iterations, headers, failures))
+        for n in range(threads_count)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    flush()
+    in_memory = {u.id: u.to_json(True) for u in User.all()}
+    User.load_from_file()
+    on_disk = {u.id: u.to_json(True) for u in User.all()}
+    if in_memory != on_disk:
+        failures.append("store reloaded from disk differs from memory")
+    expected = 1 + threads_count * (iterations // 2)
+    if User.count() != expected:
+        failures.append("{} users, expected {}".format(User.count(),
+                                                       expected))
+
+    for failure in failures[:20]:
+        print(failure)
+    print("{} threads x {} iterations: {} failures".format(
+        threads_count, iterations, len(failures)))
+    sys.exit(1 if failures else 0)
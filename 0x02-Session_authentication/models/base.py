@@ -2,38 +2,153 @@
 """ Base module
 """
 from datetime import datetime
-from typing import TypeVar, List, Iterable
-from os import path
+from typing import TypeVar, List, Iterable, Tuple
+from os import getenv
+import atexit
 import json
 import uuid
 
+from models.query import OPERATORS
+
 
 TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
-DATA = {}
+TIMESTAMP_ATTRIBUTES = ('created_at', 'updated_at')
+FIELDS = {}
+DURABILITY = getenv('DB_DURABILITY', 'sync')
+STORAGE = getenv('DB_STORAGE', 'json')
+SQLITE_PATH = getenv('DB_SQLITE_PATH', '.db.sqlite3')
+BACKEND = None
+
+
+def flush():
+    """ Write every mutation the storage engine still holds in memory
+    (`DB_DURABILITY=batched` or `shutdown`); runs at exit
+    """
+    if BACKEND is not None:
+        BACKEND.flush()
+
+
+atexit.register(flush)
+
+
+def storage():
+    """ Return the storage engine selected by `DB_STORAGE`: `json`
+    (default) or `sqlite`
+    """
+    global BACKEND
+    if BACKEND is None:
+        if STORAGE == 'json':
+            from models.json_storage import JSONStorage
+            BACKEND = JSONStorage()
+        elif STORAGE == 'sqlite':
+            from models.storage import SQLiteStorage
+            synchronous = 'FULL' if DURABILITY == 'sync' else 'NORMAL'
+            BACKEND = SQLiteStorage(SQLITE_PATH, synchronous)
+        else:
+            raise ValueError("Unknown DB_STORAGE: {} (expected json or "
+                             "sqlite)".format(STORAGE))
+    return BACKEND
+
+
+def _parse_timestamp(text: str) -> datetime:
+    """ Parse a TIMESTAMP_FORMAT string
+
+    `datetime.fromisoformat` is several times faster than `strptime` and
+    reads TIMESTAMP_FORMAT strings identically, so it is tried first.
+    """
+    if len(text) == 19 and text[10] == 'T':
+        try:
+            return datetime.fromisoformat(text)
+        except ValueError:
+            pass
+    return datetime.strptime(text, TIMESTAMP_FORMAT)
+
+
+def _attribute(obj, name: str):
+    """ Read an attribute of an object or of its serialized form, where
+    timestamps are parsed back to datetimes
+    """
+    if type(obj) is dict:
+        value = obj.get(name)
+        if type(value) is str and name in TIMESTAMP_ATTRIBUTES:
+            return _parse_timestamp(value)
+        return value
+    return getattr(obj, name, None)
+
+
+def _fields(cls: type) -> tuple:
+    """ Names of the slot attributes of a class, base classes first
+    """
+    fields = FIELDS.get(cls)
+    if fields is None:
+        fields = tuple(
+            name
+            for klass in reversed(cls.__mro__)
+            for name in klass.__dict__.get('__slots__', ())
+            if name not in ('__dict__', '__weakref__', '_cache')
+        )
+        FIELDS[cls] = fields
+    return fields
 
 
 class Base():
     """ Base class
+
+    Models declare their attributes in `__slots__`: instances carry no
+    per-object `__dict__`. The `_cache` slot memoizes serialized forms
+    until an attribute changes.
+
+    Objects are kept by the storage engine that `storage()` returns
+    (`DB_STORAGE`): class methods that read or write them delegate to it.
     """
 
+    __slots__ = ('id', 'created_at', 'updated_at', '_cache')
+    indexed_attributes = ()
+    sorted_attributes = ('id', 'created_at')
+
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a Base instance
         """
-        s_class = str(self.__class__.__name__)
-        if DATA.get(s_class) is None:
-            DATA[s_class] = {}
-
-        self.id = kwargs.get('id', str(uuid.uuid4()))
-        if kwargs.get('created_at') is not None:
-            self.created_at = datetime.strptime(kwargs.get('created_at'),
-                                                TIMESTAMP_FORMAT)
+        self._cache = None
+        obj_id = kwargs.get('id')
+        if obj_id is None and 'id' not in kwargs:
+            obj_id = str(uuid.uuid4())
+        self.id = obj_id
+        created_at = kwargs.get('created_at')
+        updated_at = kwargs.get('updated_at')
+        now = None
+        if type(created_at) is datetime:
+            self.created_at = created_at
+        elif created_at is not None:
+            self.created_at = _parse_timestamp(created_at)
+        else:
+            self.created_at = now = datetime.utcnow()
+        if updated_at is not None and updated_at == created_at:
+            # datetime is immutable: equal timestamps share one object
+            self.updated_at = self.created_at
+        elif type(updated_at) is datetime:
+            self.updated_at = updated_at
+        elif updated_at is not None:
+            self.updated_at = _parse_timestamp(updated_at)
         else:
-            self.created_at = datetime.utcnow()
-        if kwargs.get('updated_at') is not None:
-            self.updated_at = datetime.strptime(kwargs.get('updated_at'),
-                                                TIMESTAMP_FORMAT)
+            self.updated_at = now or datetime.utcnow()
+
+    def __setattr__(self, name: str, value):
+        """ Set an attribute, keeping secondary indexes and the
+        serialization cache current
+        """
+        if name in self.indexed_attributes or name in self.sorted_attributes:
+            storage().update_attribute(self, name, value)
         else:
-            self.updated_at = datetime.utcnow()
+            super().__setattr__(name, value)
+        if name != '_cache' and self._cache:
+            # only `name` and the whole-object forms are stale; the dict
+            # is replaced, not updated, so a concurrent to_json() that
+            # read the old values fills a cache nobody reads any more
+            super().__setattr__('_cache', {
+                k: v for k, v in self._cache.items()
+                if type(k) is str and k != name
+            })
 
     def __eq__(self, other: TypeVar('Base')) -> bool:
         """ Equality
@@ -44,69 +159,142 @@ class Base():
             return False
         return (self.id == other.id)
 
+    def _json_cache(self) -> dict:
+        """ Return the serialization cache of the object: serialized
+        datetimes by attribute name, whole forms by `(kind, full)`
+        """
+        cache = self._cache
+        if cache is None:
+            cache = {}
+            super().__setattr__('_cache', cache)
+        return cache
+
     def to_json(self, for_serialization: bool = False) -> dict:
         """ Convert the object a JSON dictionary
+
+        The result is memoized until an attribute of the object changes;
+        then only the changed datetimes are formatted again.
+        """
+        cache = self._json_cache()
+        result = cache.get(('dict', for_serialization))
+        if result is None:
+            result = self._serialize(for_serialization, cache)
+            cache[('dict', for_serialization)] = result
+        return dict(result)
+
+    def to_json_text(self, for_serialization: bool = False) -> str:
+        """ Return `to_json()` encoded as compact JSON text, with sorted
+        keys like `jsonify`, memoized the same way
+        """
+        cache = self._json_cache()
+        text = cache.get(('text', for_serialization))
+        if text is None:
+            text = json.dumps(self.to_json(for_serialization),
+                              sort_keys=True, separators=(',', ':'))
+            cache[('text', for_serialization)] = text
+        return text
+
+    def _serialize(self, for_serialization: bool, cache: dict) -> dict:
+        """ Build the JSON dictionary of the object
         """
         result = {}
-        for key, value in self.__dict__.items():
+        items = []
+        for key in _fields(self.__class__):
+            try:
+                items.append((key, getattr(self, key)))
+            except AttributeError:
+                continue
+        if hasattr(self, '__dict__'):
+            items.extend(self.__dict__.items())
+        for key, value in items:
             if not for_serialization and key[0] == '_':
                 continue
             if type(value) is datetime:
-                result[key] = value.strftime(TIMESTAMP_FORMAT)
+                text = cache.get(key)
+                if text is None:
+                    text = cache[key] = value.strftime(TIMESTAMP_FORMAT)
+                result[key] = text
             else:
                 result[key] = value
         return result
 
     @classmethod
-    def load_from_file(cls):
-        """ Load all objects from file
+    def sync(cls):
+        """ Catch up with the changes other processes made to the objects
+        of the class (`DB_SHARED`)
+        """
+        storage().sync(cls)
+
+    @classmethod
+    def revision(cls) -> int:
+        """ Counter bumped by every change to the objects of the class,
+        made in this process or, when the store is shared, by another one
+
+        Lets a cache remember what it saw: equal revisions mean no object
+        was saved, removed or reloaded in between.
         """
-        s_class = cls.__name__
-        file_path = ".db_{}.json".format(s_class)
-        DATA[s_class] = {}
-        if not path.exists(file_path):
-            return
+        return storage().revision(cls)
+
+    @classmethod
+    def load_from_file(cls, lazy: bool = None):
+        """ Load all objects of the class from its storage
 
-        with open(file_path, 'r') as f:
-            objs_json = json.load(f)
-            for obj_id, obj_json in objs_json.items():
-                DATA[s_class][obj_id] = cls(**obj_json)
+        With the JSON store, `lazy` (default: `DB_LOAD_MODE=lazy`) keeps
+        records as their JSON text until they are first accessed.
+        """
+        storage().load(cls, lazy)
 
     @classmethod
     def save_to_file(cls):
-        """ Save all objects to file
+        """ Rewrite the storage of the class compactly (JSON store: save a
+        snapshot and reset the journal)
+        """
+        storage().compact(cls)
+
+    @classmethod
+    def bulk_save(cls, objs: Iterable[TypeVar('Base')]):
+        """ Save several objects like `save()`, persisting them at once
         """
-        s_class = cls.__name__
-        file_path = ".db_{}.json".format(s_class)
-        objs_json = {}
-        for obj_id, obj in DATA[s_class].items():
-            objs_json[obj_id] = obj.to_json(True)
+        objs = list(objs)
+        now = datetime.utcnow()
+        for obj in objs:
+            obj.updated_at = now
+        storage().save_many(cls, objs)
 
-        with open(file_path, 'w') as f:
-            json.dump(objs_json, f)
+    @classmethod
+    def bulk_create(cls, records: Iterable[dict]) -> List[TypeVar('Base')]:
+        """ Create and persist at once one object per serialized record
+
+        Unlike `bulk_save()`, the `id`, `created_at` and `updated_at` of
+        the records are kept as given (TIMESTAMP_FORMAT strings or
+        datetimes), which is what an import needs.
+        """
+        objs = [cls(**record) for record in records]
+        storage().save_many(cls, objs)
+        return objs
 
     def save(self):
         """ Save current object
         """
-        s_class = self.__class__.__name__
         self.updated_at = datetime.utcnow()
-        DATA[s_class][self.id] = self
-        self.__class__.save_to_file()
+        storage().save_many(self.__class__, [self])
+
+    @classmethod
+    def bulk_remove(cls, objs: Iterable[TypeVar('Base')]):
+        """ Remove several objects like `remove()`, persisting them at once
+        """
+        storage().remove_many(cls, list(objs))
 
     def remove(self):
         """ Remove object
         """
-        s_class = self.__class__.__name__
-        if DATA[s_class].get(self.id) is not None:
-            del DATA[s_class][self.id]
-            self.__class__.save_to_file()
+        storage().remove_many(self.__class__, [self])
 
     @classmethod
     def count(cls) -> int:
         """ Count all objects
         """
-        s_class = cls.__name__
-        return len(DATA[s_class].keys())
+        return storage().count(cls)
 
     @classmethod
     def all(cls) -> Iterable[TypeVar('Base')]:
@@ -114,24 +302,64 @@ class Base():
         """
         return cls.search()
 
+    @classmethod
+    def page(cls, limit: int = None,
+             after: str = None) -> List[TypeVar('Base')]:
+        """ Return up to `limit` objects ordered by ID, starting right
+        after the ID `after` (the cursor: last ID of the previous page)
+        """
+        return storage().page(cls, limit, after)
+
     @classmethod
     def get(cls, id: str) -> TypeVar('Base'):
         """ Return one object by ID
         """
-        s_class = cls.__name__
-        return DATA[s_class].get(id)
+        return storage().get(cls, id)
+
+    @classmethod
+    def _conditions(cls, conditions: Iterable[Tuple[str, str, object]]
+                    ) -> List[Tuple[str, str, object]]:
+        """ Check the operators of query conditions, and parse timestamps
+        given as TIMESTAMP_FORMAT strings
+        """
+        checked = []
+        for attribute, op, value in conditions or ():
+            if op not in OPERATORS:
+                raise ValueError("Unknown operator: {}".format(op))
+            if type(value) is str and attribute in TIMESTAMP_ATTRIBUTES:
+                value = _parse_timestamp(value)
+            checked.append((attribute, op, value))
+        return checked
 
     @classmethod
-    def search(cls, attributes: dict = {}) -> List[TypeVar('Base')]:
+    def query(cls, conditions: Iterable[Tuple[str, str, object]] = None,
+              order_by: str = None, descending: bool = False,
+              limit: int = None) -> List[TypeVar('Base')]:
+        """ Return up to `limit` objects meeting every `(attribute,
+        operator, value)` condition, ordered by `order_by`
+
+        Operators: ==, !=, <, <=, >, >=. The JSON store reads the most
+        selective index (see `explain()`); without `order_by`, objects come
+        in the order of that index, or in insertion order on a scan.
+        """
+        return storage().query(cls, conditions, order_by, descending, limit)
+
+    @classmethod
+    def explain(cls, conditions: Iterable[Tuple[str, str, object]] = None,
+                order_by: str = None, descending: bool = False) -> dict:
+        """ Describe how `query()` would run: index read, estimated number
+        of candidates, sort
+        """
+        return storage().explain(cls, conditions, order_by, descending)
+
+    @classmethod
+    def search(cls, attributes: dict = None) -> List[TypeVar('Base')]:
         """ Search all objects with matching attributes
+
+        Shorthand for a `query()` of `==` conditions: when one of the
+        attributes is indexed, only the objects the index returns for its
+        value are checked instead of the whole class.
         """
-        s_class = cls.__name__
-        def _search(obj):
-            if len(attributes) == 0:
-                return True
-            for k, v in attributes.items():
-                if (getattr(obj, k) != v):
-                    return False
-            return True
-        
-        return list(filter(_search, DATA[s_class].values()))
+        if attributes is None:
+            attributes = {}
+        return storage().search(cls, attributes)
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+""" Bulk import module
+
+Usage: python3 -m models.bulk_import FILE [batch_size]
+
+Imports users from FILE, a CSV file with a header row (`.csv`) or one
+JSON object per line (any other extension). Columns / keys:
+  - email (required, unique)
+  - password (plain text, hashed on import) or _password (SHA256 hash)
+  - first_name, last_name (optional)
+  - id (optional, unique), created_at, updated_at (optional, in
+    `%Y-%m-%dT%H:%M:%S`): kept when given
+
+Invalid records, lines that are not a JSON object included, are reported
+on stderr and skipped; valid ones are persisted `batch_size` (default
+10000) at a time with `User.bulk_create`.
+"""
+import csv
+import hashlib
+import json
+import sys
+import time
+from typing import Iterator, Tuple, Union
+
+from models.base import TIMESTAMP_ATTRIBUTES, TIMESTAMP_FORMAT, \
+    _parse_timestamp
+from models.user import User
+
+
+FIELDS = ('id', 'created_at', 'updated_at', 'email', '_password',
+          'first_name', 'last_name')
+
+
+def read_records(file_path: str) -> Iterator[Tuple[int, Union[dict, str]]]:
+    """ Yield `(line number, record)` for every record of `file_path`: a
+    dict for a CSV row, the undecoded line for JSON (see `parse`)
+    """
+    with open(file_path, 'r', newline='') as f:
+        if file_path.endswith('.csv'):
+            reader = csv.DictReader(f)
+            for record in reader:
+                yield reader.line_num, record
+            return
+        for line_number, line in enumerate(f, 1):
+            if line.strip():
+                yield line_number, line
+
+
+def parse(record: Union[dict, str]) -> dict:
+    """ Return the dict of a record of `read_records`, or raise ValueError
+    if it is not a JSON object
+    """
+    if type(record) is str:
+        record = json.loads(record)
+    if type(record) is not dict:
+        raise ValueError("record must be a JSON object")
+    return record
+
+
+def validate(record: dict, emails: set, ids: set) -> dict:
+    """ Return the attributes of the User of `record`, timestamps parsed,
+    or raise ValueError
+
+    `emails` and `ids` are those of the records already accepted from the
+    file, which are not in the store yet.
+    """
+    attributes = {}
+    email = record.get('email')
+    if type(email) is not str or len(email.strip()) == 0:
+        raise ValueError("email missing")
+    if email in emails or len(User.search({'email': email})) > 0:
+        raise ValueError("email {} already exists".format(email))
+    obj_id = record.get('id')
+    if obj_id not in (None, ''):
+        if type(obj_id) is not str:
+            raise ValueError("id must be a string")
+        if obj_id in ids or User.get(obj_id) is not None:
+            raise ValueError("id {} already exists".format(obj_id))
+    for name in TIMESTAMP_ATTRIBUTES:
+        value = record.get(name)
+        if value in (None, ''):
+            continue
+        try:
+            # parsed once: User accepts the datetimes as they are
+            attributes[name] = _parse_timestamp(value)
+        except (ValueError, TypeError):
+            raise ValueError("{} must match {}: {}".format(
+                name, TIMESTAMP_FORMAT, value))
+    password = record.get('password')
+    if password not in (None, ''):
+        if type(password) is not str:
+            raise ValueError("password must be a string")
+        # like the User.password setter, without building a User
+        record['_password'] = \
+            hashlib.sha256(password.encode()).hexdigest().lower()
+    if record.get('_password') in (None, ''):
+        raise ValueError("password missing")
+    for name in FIELDS:
+        if name not in attributes and record.get(name) not in (None, ''):
+            attributes[name] = record[name]
+    return attributes
+
+
+def bulk_import(file_path: str, batch_size: int = 10000) -> dict:
+    """ Import the users of `file_path`, return counters and throughput
+    """
+    User.load_from_file()
+    emails = set()
+    ids = set()
+    batch = []
+    imported = skipped = 0
+    start = time.perf_counter()
+    for line_number, record in read_records(file_path):
+        try:
+            record = parse(record)
+            batch.append(validate(record, emails, ids))
+            emails.add(record['email'])
+            if record.get('id') not in (None, ''):
+                ids.add(record['id'])
+        except (ValueError, TypeError) as e:
+            skipped += 1
+            print("{}:{}: {}".format(file_path, line_number, e),
+                  file=sys.stderr)
+            continue
+        if len(batch) >= batch_size:
+            imported += len(User.bulk_create(batch))
+            batch = []
+    if len(batch) > 0:
+        imported += len(User.bulk_create(batch))
+    seconds = time.perf_counter() - start
+    return {
+        'imported': imported,
+        'skipped': skipped,
+        'seconds': seconds,
+        'users_per_second': imported / seconds if seconds > 0 else 0,
+    }
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python3 -m models.bulk_import FILE [batch_size]",
+              file=sys.stderr)
+        sys.exit(2)
+    batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+    report = bulk_import(sys.argv[1], batch_size)
+    print("{imported} users imported, {skipped} skipped in {seconds:.2f} s "
+          "({users_per_second:.0f} users/s)".format(**report))
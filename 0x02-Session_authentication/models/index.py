@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+""" Index module
+"""
+from bisect import bisect_left, bisect_right
+from typing import Hashable, List, Tuple
+
+
+class _Above():
+    """ Sorts after any ID: `(value, ABOVE)` bounds every key of `value`
+    """
+
+    def __lt__(self, other) -> bool:
+        return False
+
+    def __gt__(self, other) -> bool:
+        return True
+
+
+ABOVE = _Above()
+
+
+class HashIndex():
+    """ Secondary index mapping one attribute value to object IDs
+
+    A value held by a single object maps straight to its ID; only values
+    shared by several objects get an ordered `{id: None}` dict.
+    """
+
+    def __init__(self, attribute: str):
+        """ Initialize an empty index on `attribute`
+        """
+        self.attribute = attribute
+        self.entries = {}
+
+    def add(self, obj_id: str, value: Hashable):
+        """ Register `obj_id` under `value`
+
+        Unhashable values are not indexed: lookups on them raise
+        TypeError and callers fall back to a scan.
+        """
+        try:
+            ids = self.entries.get(value)
+        except TypeError:
+            return
+        if ids is None:
+            self.entries[value] = obj_id
+        elif type(ids) is dict:
+            ids[obj_id] = None
+        elif ids != obj_id:
+            self.entries[value] = {ids: None, obj_id: None}
+
+    def discard(self, obj_id: str, value: Hashable):
+        """ Unregister `obj_id` from `value`, if present
+        """
+        try:
+            ids = self.entries.get(value)
+        except TypeError:
+            return
+        if ids is None:
+            return
+        if type(ids) is not dict:
+            if ids == obj_id:
+                del self.entries[value]
+            return
+        ids.pop(obj_id, None)
+        if len(ids) == 1:
+            self.entries[value] = next(iter(ids))
+
+    def lookup(self, value: Hashable) -> List[str]:
+        """ Return IDs registered under `value`, in insertion order
+        """
+        ids = self.entries.get(value)
+        if ids is None:
+            return []
+        if type(ids) is not dict:
+            return [ids]
+        return list(ids)
+
+    def count(self, value: Hashable) -> int:
+        """ Number of IDs registered under `value`
+        """
+        ids = self.entries.get(value)
+        if ids is None:
+            return 0
+        return len(ids) if type(ids) is dict else 1
+
+    def clear(self):
+        """ Drop every entry
+        """
+        self.entries = {}
+
+
+class SortedIndex():
+    """ Secondary index keeping object IDs ordered by one attribute value
+
+    Entries are sort keys: the ID itself for the `id` attribute, else
+    `(value, id)`. Like unhashable values in HashIndex, None and values
+    that do not compare with the others are not indexed, and lookups on
+    them raise TypeError so that callers fall back to a scan.
+
+    Insertions cost a bisect plus a list insert. A `deferred` index only
+    collects added and removed keys until `sort()`, which is how a whole
+    store, a bulk import or a bulk removal is indexed at once.
+    """
+
+    def __init__(self, attribute: str, deferred: bool = False):
+        """ Initialize an empty index on `attribute`
+        """
+        self.attribute = attribute
+        self.keys = []
+        self.pending = {} if deferred else None
+        self.removed = set() if deferred else None
+
+    def _key(self, obj_id: str, value):
+        """ Sort key of one entry
+        """
+        if self.attribute == 'id':
+            return obj_id
+        if value is None:
+            raise TypeError("None is not indexed")
+        return (value, obj_id)
+
+    def add(self, obj_id: str, value):
+        """ Register `obj_id` under `value`
+        """
+        try:
+            key = self._key(obj_id, value)
+            if self.pending is not None:
+                self.pending[key] = None
+                return
+            i = bisect_left(self.keys, key)
+        except TypeError:
+            return
+        if i == len(self.keys) or self.keys[i] != key:
+            self.keys.insert(i, key)
+
+    def discard(self, obj_id: str, value):
+        """ Unregister `obj_id` from `value`, if present
+        """
+        try:
+            key = self._key(obj_id, value)
+            if self.pending is not None:
+                if key in self.pending:
+                    del self.pending[key]
+                else:
+                    self.removed.add(key)
+                return
+            i = bisect_left(self.keys, key)
+        except TypeError:
+            return
+        if i < len(self.keys) and self.keys[i] == key:
+            del self.keys[i]
+
+    def defer(self):
+        """ Collect the keys added or removed from now on until `sort()`
+        """
+        if self.pending is None:
+            self.pending = {}
+            self.removed = set()
+
+    def sort(self):
+        """ Apply the keys collected since the index was deferred
+        """
+        if self.pending is not None:
+            keys = self.keys
+            if self.removed:
+                # one linear pass instead of one list deletion per key
+                keys = [key for key in keys if key not in self.removed]
+            # two sorted runs: timsort merges them in linear time
+            self.keys = sorted(keys + sorted(self.pending))
+            self.pending = None
+            self.removed = None
+
+    def lookup(self, value) -> List[str]:
+        """ Return IDs registered under `value`, in ID order
+        """
+        if value is None:
+            raise TypeError("None is not indexed")
+        return self.between(value, value)
+
+    def _bounds(self, value) -> Tuple:
+        """ Lowest and highest possible keys of `value`
+        """
+        if self.attribute == 'id':
+            return value, value
+        return (value,), (value, ABOVE)
+
+    def span(self, low=None, high=None, low_inclusive: bool = True,
+             high_inclusive: bool = True) -> Tuple[int, int]:
+        """ Return the positions `(start, end)` of the keys whose value
+        lies between `low` and `high` (None: unbounded)
+        """
+        keys = self.keys
+        start, end = 0, len(keys)
+        if low is not None:
+            lowest, highest = self._bounds(low)
+            start = bisect_left(keys, lowest) if low_inclusive \
+                else bisect_right(keys, highest)
+        if high is not None:
+            lowest, highest = self._bounds(high)
+            end = bisect_right(keys, highest) if high_inclusive \
+                else bisect_left(keys, lowest)
+        return start, max(start, end)
+
+    def between(self, low=None, high=None, low_inclusive: bool = True,
+                high_inclusive: bool = True,
+                reverse: bool = False) -> List[str]:
+        """ Return the IDs whose value lies between `low` and `high` (None:
+        unbounded), ordered by value then ID, or the other way round
+        """
+        start, end = self.span(low, high, low_inclusive, high_inclusive)
+        keys = self.keys[start:end]
+        if reverse:
+            keys.reverse()
+        if self.attribute == 'id':
+            return keys
+        return [key[1] for key in keys]
+
+    def after(self, obj_id: str = None, limit: int = None) -> List[str]:
+        """ Return up to `limit` IDs of an `id` index, following `obj_id`
+        """
+        keys = self.keys
+        start = 0 if obj_id is None else bisect_right(keys, obj_id)
+        end = None if limit is None else start + limit
+        return keys[start:end]
+
+    def clear(self):
+        """ Drop every entry
+        """
+        self.keys = []
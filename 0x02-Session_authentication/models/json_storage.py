@@ -0,0 +1,532 @@
+#!/usr/bin/env python3
+""" JSON storage module
+
+Default storage engine of `models.base.Base` (`DB_STORAGE=json`): every
+object lives in memory, in DATA, with secondary indexes in INDEXES; each
+class is persisted to a JSON snapshot and a journal of the mutations made
+since (see `models.persistence`).
+"""
+from itertools import islice
+from typing import TypeVar, List, Iterable, Tuple, Union
+from os import getenv
+import contextlib
+import json
+import threading
+
+from models.base import DURABILITY, _attribute
+from models.index import HashIndex, SortedIndex
+from models.persistence import (
+    FileLock, Flusher, Journal, file_version, iter_snapshot, write_snapshot,
+)
+from models.query import matches, plan
+from models.storage import Storage
+
+
+DATA = {}
+JOURNALS = {}
+INDEXES = {}
+LOCKS = {}
+HYDRATION_LOCKS = {}
+JOURNAL_MAX_RECORDS = int(getenv('DB_JOURNAL_MAX_RECORDS', '1000'))
+LOAD_MODE = getenv('DB_LOAD_MODE', 'eager')
+FLUSH_INTERVAL = float(getenv('DB_FLUSH_INTERVAL', '1.0'))
+FLUSH_MAX_PENDING = int(getenv('DB_FLUSH_MAX_PENDING', '100'))
+PENDING = {}
+PENDING_LOCK = threading.Lock()
+FLUSH_LOCK = threading.RLock()
+FLUSHER = None
+SHARED = getenv('DB_SHARED', 'false').lower() in ('1', 'true', 'yes')
+FILE_LOCKS = {}
+VERSIONS = {}
+REVISIONS = {}
+
+
+class JSONStorage(Storage):
+    """ Storage engine keeping every object in memory, persisted to a JSON
+    snapshot and journal per class
+
+    Concurrency: writers of a class (save, remove, load, updates of an
+    indexed attribute) serialize on its `lock()`. Readers (get, search,
+    count, page) take no lock: they work on atomic copies of DATA and of
+    the indexes, so they never wait on a writer or on disk I/O. Lazily
+    loaded records are installed under `_hydration_lock()`, which writers
+    only hold to replace an entry of DATA.
+
+    Several processes (`DB_SHARED`): the journal is the change feed.
+    Writers also hold the lock file of the class and journal at once;
+    before each read or write a process compares the snapshot and the
+    journal with what it last applied, and only reads the new records.
+    """
+
+    def flush(self):
+        """ Write every pending mutation to its journal (group commit)
+
+        Under `DB_DURABILITY=batched` the background flusher calls this
+        every `DB_FLUSH_INTERVAL` seconds or once `DB_FLUSH_MAX_PENDING`
+        mutations are waiting; under `DB_DURABILITY=shutdown` it only runs
+        at exit.
+        """
+        with FLUSH_LOCK:
+            with PENDING_LOCK:
+                batches = list(PENDING.items())
+                PENDING.clear()
+            for i, (cls, records) in enumerate(batches):
+                try:
+                    self.journal(cls).extend(records)
+                except Exception:
+                    with PENDING_LOCK:
+                        for pending_cls, pending in batches[i:]:
+                            PENDING[pending_cls] = \
+                                pending + PENDING.get(pending_cls, [])
+                    raise
+                self._compact_if_needed(cls)
+
+    def _flusher(self) -> Flusher:
+        """ Return the background flusher, starting it on first use
+        """
+        global FLUSHER
+        with PENDING_LOCK:
+            if FLUSHER is None:
+                FLUSHER = Flusher(self.flush, FLUSH_INTERVAL)
+                FLUSHER.start()
+        return FLUSHER
+
+    def memory_only(self) -> bool:
+        """ Reads only touch memory, unless other processes share the store
+
+        Lazily loaded records (`DB_LOAD_MODE=lazy`) are no exception: they
+        are built from the JSON text already in memory, and `_hydrate` never
+        waits on a writer's journal I/O.
+        """
+        return not SHARED
+
+    def objects(self, cls: type) -> dict:
+        """ Return the stored objects of the class, by ID
+        """
+        s_class = cls.__name__
+        return DATA.get(s_class) or DATA.setdefault(s_class, {})
+
+    def lock(self, cls: type) -> threading.RLock:
+        """ Return the writer lock of the class
+        """
+        s_class = cls.__name__
+        return LOCKS.get(s_class) or \
+            LOCKS.setdefault(s_class, threading.RLock())
+
+    def _hydration_lock(self, cls: type, objs: dict):
+        """ Return the lock guarding the entries of `objs` against a
+        concurrent hydration, when `objs` are the live objects of the class
+        """
+        s_class = cls.__name__
+        if objs is not DATA.get(s_class):
+            return contextlib.nullcontext()
+        return HYDRATION_LOCKS.get(s_class) or \
+            HYDRATION_LOCKS.setdefault(s_class, threading.Lock())
+
+    @contextlib.contextmanager
+    def _process_lock(self, cls: type):
+        """ Hold the writer lock of the class and, with `DB_SHARED`, its
+        lock file, so that writers of every process take turns
+        """
+        with self.lock(cls):
+            if not SHARED:
+                yield
+                return
+            s_class = cls.__name__
+            file_lock = FILE_LOCKS.get(s_class)
+            if file_lock is None:
+                file_lock = FILE_LOCKS[s_class] = \
+                    FileLock(".db_{}.lock".format(s_class))
+            with file_lock:
+                yield
+
+    def _changed(self, cls: type) -> bool:
+        """ Tell whether the snapshot or the journal moved past what this
+        process last applied
+        """
+        s_class = cls.__name__
+        journal = self.journal(cls)
+        snapshot = file_version(".db_{}.json".format(s_class))
+        return journal.size() != journal.offset or \
+            snapshot != VERSIONS.get(s_class)
+
+    def sync(self, cls: type):
+        """ Apply the mutations other processes made since the last sync
+        (`DB_SHARED` only): costs two `stat` calls when there is none
+        """
+        if SHARED and self._changed(cls):
+            with self._process_lock(cls):
+                self._catch_up(cls)
+
+    def _catch_up(self, cls: type):
+        """ Apply the journal records appended by other processes, or
+        reload after another process compacted; needs `_process_lock()`
+        """
+        if not SHARED or not self._changed(cls):
+            return
+        s_class = cls.__name__
+        journal = self.journal(cls)
+        snapshot = file_version(".db_{}.json".format(s_class))
+        if snapshot != VERSIONS.get(s_class) or \
+                journal.size() < journal.offset:
+            self.load(cls)
+            return
+        records = journal.tail()
+        sorted_indexes = [
+            index for index in self.indexes(cls).values()
+            if isinstance(index, SortedIndex)
+        ]
+        if len(records) > 1:
+            for index in sorted_indexes:
+                index.defer()
+        try:
+            for record in records:
+                self._apply(cls, record, LOAD_MODE == 'lazy')
+        finally:
+            for index in sorted_indexes:
+                index.sort()
+            self._revise(cls)
+
+    def revision(self, cls: type) -> int:
+        """ Return the number of changes made to the class in this process
+        or (`DB_SHARED`) applied from another one
+        """
+        self.sync(cls)
+        return REVISIONS.get(cls.__name__, 0)
+
+    def _revise(self, cls: type):
+        """ Bump the revision of the class
+        """
+        s_class = cls.__name__
+        REVISIONS[s_class] = REVISIONS.get(s_class, 0) + 1
+
+    def _new_indexes(self, cls: type, deferred: bool = False) -> dict:
+        """ Build empty secondary indexes for the class, by attribute
+
+        `indexed_attributes` get a HashIndex, `sorted_attributes` a
+        SortedIndex (which also answers equality lookups).
+        """
+        indexes = {
+            attribute: HashIndex(attribute)
+            for attribute in cls.indexed_attributes
+        }
+        for attribute in cls.sorted_attributes:
+            indexes[attribute] = SortedIndex(attribute, deferred)
+        return indexes
+
+    def indexes(self, cls: type) -> dict:
+        """ Return the secondary indexes of the class, by attribute
+        """
+        s_class = cls.__name__
+        if INDEXES.get(s_class) is None:
+            INDEXES.setdefault(s_class, self._new_indexes(cls))
+        return INDEXES[s_class]
+
+    def update_attribute(self, obj: TypeVar('Base'), name: str, value):
+        """ Set an indexed attribute of an object, moving it in the index
+        if the object is stored
+        """
+        cls = obj.__class__
+        obj_id = getattr(obj, 'id', None)
+        if DATA.get(cls.__name__, {}).get(obj_id) is not obj:
+            object.__setattr__(obj, name, value)
+            return
+        with self.lock(cls):
+            index = self.indexes(cls)[name]
+            index.discard(obj_id, getattr(obj, name, None))
+            object.__setattr__(obj, name, value)
+            index.add(obj_id, value)
+
+    def _store(self, cls: type, obj, obj_json: dict = None,
+               objs: dict = None, indexes: dict = None):
+        """ Put an object, or its raw JSON text, in DATA and in the indexes
+
+        `obj_json` is the decoded form of raw JSON text, when the caller
+        already has it at hand. `objs` and `indexes` default to the live
+        ones of the class; `load` passes those it is building.
+        """
+        if objs is None:
+            objs = self.objects(cls)
+        if indexes is None:
+            indexes = self.indexes(cls)
+        if obj_json is None and type(obj) is str:
+            obj_json = json.loads(obj)
+        source = obj if obj_json is None else obj_json
+        obj_id = _attribute(source, 'id')
+        previous = objs.get(obj_id)
+        if previous is obj:
+            return
+        if previous is not None:
+            self._unstore(cls, previous, objs, indexes)
+        with self._hydration_lock(cls, objs):
+            objs[obj_id] = obj
+        for attribute, index in indexes.items():
+            index.add(obj_id, _attribute(source, attribute))
+
+    def _unstore(self, cls: type, obj, objs: dict = None,
+                 indexes: dict = None):
+        """ Take an object, or its raw JSON text, out of DATA and out of
+        the indexes
+        """
+        if objs is None:
+            objs = self.objects(cls)
+        if indexes is None:
+            indexes = self.indexes(cls)
+        if type(obj) is str:
+            obj = json.loads(obj)
+        obj_id = _attribute(obj, 'id')
+        with self._hydration_lock(cls, objs):
+            del objs[obj_id]
+        for attribute, index in indexes.items():
+            index.discard(obj_id, _attribute(obj, attribute))
+
+    def _hydrate(self, cls: type, obj_id: str) -> TypeVar('Base'):
+        """ Return the stored object for an ID, building it on first access
+        if it was loaded lazily
+
+        The object is built without any lock, then installed unless a
+        writer replaced the record meanwhile: the hydration lock is only
+        held for that check, never across a writer's journal I/O.
+        """
+        objs = self.objects(cls)
+        obj = objs.get(obj_id)
+        if type(obj) is str:
+            hydrated = cls(**json.loads(obj))
+            with self._hydration_lock(cls, objs):
+                if objs.get(obj_id) is obj:
+                    objs[obj_id] = hydrated
+                obj = objs.get(obj_id)
+        return obj
+
+    def journal(self, cls: type) -> Journal:
+        """ Return the mutation journal of the class
+        """
+        s_class = cls.__name__
+        if JOURNALS.get(s_class) is None:
+            JOURNALS[s_class] = Journal(".db_{}.journal".format(s_class))
+        return JOURNALS[s_class]
+
+    def _apply(self, cls: type, record: dict, lazy: bool,
+               objs: dict = None, indexes: dict = None):
+        """ Apply one journal record to DATA and the indexes, or to the
+        `objs` and `indexes` being loaded
+        """
+        if objs is None:
+            objs = self.objects(cls)
+        if record.get('op') == 'save':
+            obj_json = record['obj']
+            if lazy:
+                self._store(cls, json.dumps(obj_json), obj_json, objs,
+                            indexes)
+            else:
+                self._store(cls, cls(**obj_json), None, objs, indexes)
+        elif record.get('op') == 'remove':
+            previous = objs.get(record['id'])
+            if previous is not None:
+                self._unstore(cls, previous, objs, indexes)
+
+    def load(self, cls: type, lazy: bool = None):
+        """ Load all objects from file, then replay the journal
+
+        The snapshot is streamed. In lazy mode (`DB_LOAD_MODE=lazy`) records
+        are kept as their JSON text and only turned into instances when
+        `get`, `page` or `query` reaches them.
+        """
+        if lazy is None:
+            lazy = LOAD_MODE == 'lazy'
+        s_class = cls.__name__
+        file_path = ".db_{}.json".format(s_class)
+        objs = {}
+        indexes = self._new_indexes(cls, deferred=True)
+        with self._process_lock(cls), FLUSH_LOCK:
+            self.flush()
+            version = file_version(file_path)
+            if version is not None:
+                for obj_id, obj_json, text in iter_snapshot(file_path):
+                    if lazy:
+                        self._store(cls, text, obj_json, objs, indexes)
+                    else:
+                        self._store(cls, cls(**obj_json), None, objs,
+                                    indexes)
+
+            for record in self.journal(cls).replay():
+                self._apply(cls, record, lazy, objs, indexes)
+
+            for index in indexes.values():
+                if isinstance(index, SortedIndex):
+                    index.sort()
+            # readers switch from the old store to the new one at once
+            DATA[s_class] = objs
+            INDEXES[s_class] = indexes
+            VERSIONS[s_class] = version
+            self._revise(cls)
+
+    def compact(self, cls: type):
+        """ Save all objects to file and reset the journal
+        """
+        s_class = cls.__name__
+        file_path = ".db_{}.json".format(s_class)
+        # flush() reaches here holding FLUSH_LOCK only, which is fine as
+        # long as nothing is pending in shared mode
+        lock = self._process_lock(cls) if SHARED else \
+            contextlib.nullcontext()
+        with lock, FLUSH_LOCK:
+            self._catch_up(cls)
+            # lazily loaded records are their JSON text already
+            write_snapshot(file_path, (
+                (obj_id, obj if type(obj) is str else obj.to_json_text(True))
+                for obj_id, obj in list(self.objects(cls).items())
+            ))
+            self.journal(cls).reset()
+            VERSIONS[s_class] = file_version(file_path)
+
+    def _compact_if_needed(self, cls: type):
+        """ Compact once the journal outgrows the store
+
+        Compaction costs O(N) but only runs every max(N, threshold)
+        records, which keeps the amortized cost of a mutation O(1).
+        """
+        if self.journal(cls).count >= max(JOURNAL_MAX_RECORDS,
+                                          len(self.objects(cls))):
+            self.compact(cls)
+
+    def _journal_extend(self, cls: type, records: List[Union[dict, str]]):
+        """ Log mutations according to `DB_DURABILITY`
+
+        - `sync` (default): written and synced before returning
+        - `batched`: queued for the background flusher
+        - `shutdown`: queued until `flush()` or process exit
+
+        With `DB_SHARED`, mutations are always written at once: other
+        processes only see what reached the journal.
+        """
+        if SHARED or DURABILITY not in ('batched', 'shutdown'):
+            with FLUSH_LOCK:
+                self.journal(cls).extend(records)
+                self._compact_if_needed(cls)
+            return
+        with PENDING_LOCK:
+            pending = PENDING.setdefault(cls, [])
+            pending.extend(records)
+            pending_count = len(pending)
+        if DURABILITY == 'batched':
+            flusher = self._flusher()
+            if pending_count >= FLUSH_MAX_PENDING:
+                flusher.wakeup.set()
+
+    def _sorted_indexes(self, cls: type, count: int) -> List[SortedIndex]:
+        """ Return the sorted indexes of the class, deferring their sort
+        when `count` objects are about to change
+        """
+        sorted_indexes = [
+            index for index in self.indexes(cls).values()
+            if isinstance(index, SortedIndex)
+        ]
+        if count > 1:
+            for index in sorted_indexes:
+                index.defer()
+        return sorted_indexes
+
+    def save_many(self, cls: type, objs: Iterable[TypeVar('Base')]):
+        """ Store objects and log them with one journal write
+        """
+        objs = list(objs)
+        with self._process_lock(cls):
+            self._catch_up(cls)
+            sorted_indexes = self._sorted_indexes(cls, len(objs))
+            try:
+                for obj in objs:
+                    self._store(cls, obj)
+            finally:
+                for index in sorted_indexes:
+                    index.sort()
+                self._revise(cls)
+            self._journal_extend(cls, [
+                '{"op": "save", "obj": ' + obj.to_json_text(True) + '}'
+                for obj in objs
+            ])
+
+    def remove_many(self, cls: type, objs: Iterable[TypeVar('Base')]):
+        """ Unstore objects and log them with one journal write
+        """
+        objs = list(objs)
+        with self._process_lock(cls):
+            self._catch_up(cls)
+            stored = self.objects(cls)
+            sorted_indexes = self._sorted_indexes(cls, len(objs))
+            records = []
+            try:
+                for obj in objs:
+                    if stored.get(obj.id) is not None:
+                        self._unstore(cls, stored[obj.id])
+                        records.append({'op': 'remove', 'id': obj.id})
+            finally:
+                for index in sorted_indexes:
+                    index.sort()
+                if len(records) > 0:
+                    self._revise(cls)
+            if len(records) > 0:
+                self._journal_extend(cls, records)
+
+    def count(self, cls: type) -> int:
+        """ Count all objects of the class
+        """
+        self.sync(cls)
+        return len(self.objects(cls))
+
+    def page(self, cls: type, limit: int = None,
+             after: str = None) -> List[TypeVar('Base')]:
+        """ Return up to `limit` objects ordered by ID, after the ID
+        `after`, read from the ID index
+        """
+        self.sync(cls)
+        obj_ids = self.indexes(cls)['id'].after(after, limit)
+        return [
+            obj for obj in (self._hydrate(cls, obj_id) for obj_id in obj_ids)
+            if obj is not None
+        ]
+
+    def get(self, cls: type, obj_id: str) -> TypeVar('Base'):
+        """ Return one object by ID, or None
+        """
+        self.sync(cls)
+        return self._hydrate(cls, obj_id)
+
+    def query(self, cls: type,
+              conditions: Iterable[Tuple[str, str, object]] = None,
+              order_by: str = None, descending: bool = False,
+              limit: int = None) -> List[TypeVar('Base')]:
+        """ Return up to `limit` objects meeting every condition, through
+        the plan of `models.query.plan`
+        """
+        self.sync(cls)
+        conditions = cls._conditions(conditions)
+        objs = self.objects(cls)
+        query_plan = plan(conditions, self.indexes(cls), len(objs),
+                          order_by, descending)
+        obj_ids = query_plan.candidates()
+        if obj_ids is None:
+            obj_ids = list(objs)
+        # IDs removed since the candidates were listed hydrate to None
+        found = (
+            obj for obj in (self._hydrate(cls, obj_id) for obj_id in obj_ids)
+            if obj is not None and matches(obj, conditions)
+        )
+        if not query_plan.ordered:
+            def sort_key(obj):
+                # None values come last, like with SQLite
+                value = getattr(obj, order_by, None)
+                return ((value is None) != descending, value)
+            found = sorted(found, key=sort_key, reverse=descending)
+        return list(islice(found, limit))
+
+    def explain(self, cls: type,
+                conditions: Iterable[Tuple[str, str, object]] = None,
+                order_by: str = None, descending: bool = False) -> dict:
+        """ Describe the plan of `query()`: index read, estimated number of
+        candidates, sort
+        """
+        self.sync(cls)
+        total = len(self.objects(cls))
+        return plan(cls._conditions(conditions), self.indexes(cls), total,
+                    order_by, descending).explain()
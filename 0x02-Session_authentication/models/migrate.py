@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+""" Migration module
+
+Usage: python3 -m models.migrate [sqlite_path]
+
+Copies the JSON file store (`.db_<Class>.json` and its journal) of every
+model into the SQLite database used by `DB_STORAGE=sqlite`
+(default `DB_SQLITE_PATH`).
+"""
+import sys
+from os import path
+
+from models.base import SQLITE_PATH
+from models.persistence import Journal, iter_snapshot
+from models.storage import SQLiteStorage
+from models.user import User
+from models.user_session import UserSession
+
+
+def read_json_store(cls: type) -> dict:
+    """ Return the serialized objects of `cls`, journal applied, by ID
+    """
+    s_class = cls.__name__
+    file_path = ".db_{}.json".format(s_class)
+    objs_json = {}
+    if path.exists(file_path):
+        for obj_id, obj_json, _ in iter_snapshot(file_path):
+            objs_json[obj_id] = obj_json
+    for record in Journal(".db_{}.journal".format(s_class)).replay():
+        if record.get('op') == 'save':
+            objs_json[record['obj']['id']] = record['obj']
+        elif record.get('op') == 'remove':
+            objs_json.pop(record['id'], None)
+    return objs_json
+
+
+def migrate(sqlite_path: str, classes: list) -> dict:
+    """ Copy every class of `classes` into `sqlite_path`, return the
+    number of objects copied by class name
+    """
+    sqlite = SQLiteStorage(sqlite_path)
+    copied = {}
+    for cls in classes:
+        objs_json = read_json_store(cls)
+        sqlite.load(cls)
+        sqlite.save_many(cls, [cls(**obj_json)
+                               for obj_json in objs_json.values()])
+        copied[cls.__name__] = len(objs_json)
+    return copied
+
+
+if __name__ == "__main__":
+    sqlite_path = sys.argv[1] if len(sys.argv) > 1 else SQLITE_PATH
+    for s_class, count in migrate(sqlite_path, [User, UserSession]).items():
+        print("{}: {} objects".format(s_class, count))
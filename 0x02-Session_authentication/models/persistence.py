@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+""" Persistence module
+
+On-disk layout of a model class `<Class>`:
+  - `.db_<Class>.json`: last snapshot, `{id: serialized object}`
+  - `.db_<Class>.journal`: one JSON record per line for every
+    save/remove applied since that snapshot
+  - `.db_<Class>.lock`: lock file serializing writers across processes
+    (`DB_SHARED` only)
+"""
+import fcntl
+import json
+import logging
+import os
+import threading
+from typing import Callable, Iterable, Iterator, List, Tuple, Union
+
+
+def file_version(file_path: str) -> Tuple[int, int, int]:
+    """ Return `(inode, mtime, size)` of a file, or None if it is missing
+
+    Snapshots are replaced by a rename, so any new snapshot changes it.
+    """
+    try:
+        st = os.stat(file_path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def write_snapshot(file_path: str, items: Iterable[Tuple[str, str]]):
+    """ Atomically replace `file_path` with the `(id, JSON text of the
+    object)` pairs of `items`
+
+    The snapshot is written to a temporary file, synced to disk and then
+    renamed over the previous one, so a crash leaves either the old or
+    the new snapshot, never a torn one.
+    """
+    tmp_path = "{}.tmp".format(file_path)
+    with open(tmp_path, 'w') as f:
+        f.write("{")
+        for i, (obj_id, text) in enumerate(items):
+            f.write("{}{}: {}".format(", " if i else "", json.dumps(obj_id),
+                                      text))
+        f.write("}")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, file_path)
+
+
+def iter_snapshot(file_path: str, chunk_size: int = 1 << 16
+                  ) -> Iterator[Tuple[str, dict, str]]:
+    """ Stream `(id, serialized object, JSON text of the object)` out of
+    a snapshot
+
+    Only `chunk_size` characters plus the record being decoded are held in
+    memory, instead of the whole decoded file as with `json.load`.
+    """
+    decoder = json.JSONDecoder()
+    with open(file_path, 'r') as f:
+        buf, pos, eof = '', 0, False
+
+        def fill():
+            """ Drop consumed input and read the next chunk """
+            nonlocal buf, pos, eof
+            chunk = f.read(chunk_size)
+            eof = chunk == ''
+            buf = buf[pos:] + chunk
+            pos = 0
+
+        def peek() -> str:
+            """ Skip whitespace, return the next character ('' at EOF) """
+            nonlocal pos
+            while True:
+                while pos < len(buf) and buf[pos] in ' \t\n\r':
+                    pos += 1
+                if pos < len(buf) or eof:
+                    return buf[pos:pos + 1]
+                fill()
+
+        def decode() -> Tuple[object, str]:
+            """ Decode the JSON value starting at the current position """
+            nonlocal pos
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buf, pos)
+                    if end < len(buf) or eof:
+                        text = buf[pos:end]
+                        pos = end
+                        return value, text
+                except ValueError:
+                    if eof:
+                        raise
+                fill()
+
+        if peek() != '{':
+            raise ValueError("Malformed snapshot: {}".format(file_path))
+        pos += 1
+        while True:
+            c = peek()
+            if c == '}':
+                return
+            if c == ',':
+                pos += 1
+                continue
+            if c == '':
+                raise ValueError("Truncated snapshot: {}".format(file_path))
+            key, _ = decode()
+            if peek() != ':':
+                raise ValueError("Malformed snapshot: {}".format(file_path))
+            pos += 1
+            peek()
+            value, text = decode()
+            yield key, value, text
+
+
+class Journal():
+    """ Append-only log of mutations applied on top of a snapshot
+    """
+
+    def __init__(self, file_path: str):
+        """ Initialize a Journal bound to `file_path`
+        """
+        self.file_path = file_path
+        self.count = 0
+        self.offset = 0
+
+    def append(self, record: Union[dict, str]):
+        """ Durably append one record
+        """
+        self.extend([record])
+
+    def extend(self, records: List[Union[dict, str]]):
+        """ Durably append several records with a single write and sync
+
+        A record is a dictionary, or its JSON text when already encoded.
+        """
+        lines = "".join(
+            (record if type(record) is str else json.dumps(record)) + "\n"
+            for record in records
+        )
+        with open(self.file_path, 'a') as f:
+            f.write(lines)
+            f.flush()
+            os.fsync(f.fileno())
+            self.offset = os.fstat(f.fileno()).st_size
+        self.count += len(records)
+
+    def replay(self) -> Iterator[dict]:
+        """ Yield every complete record of the journal, in order
+
+        A trailing record left incomplete by a crash is dropped and cut
+        off the file so that later appends start on a clean line.
+        """
+        self.count = 0
+        self.offset = 0
+        if not os.path.exists(self.file_path):
+            return
+        good_offset = 0
+        with open(self.file_path, 'rb') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                if not line.endswith(b"\n"):
+                    break
+                good_offset += len(line)
+                self.count += 1
+                yield record
+        if good_offset < os.path.getsize(self.file_path):
+            with open(self.file_path, 'r+b') as f:
+                f.truncate(good_offset)
+                os.fsync(f.fileno())
+        self.offset = good_offset
+
+    def size(self) -> int:
+        """ Current size of the journal file, 0 if it is missing
+        """
+        try:
+            return os.path.getsize(self.file_path)
+        except FileNotFoundError:
+            return 0
+
+    def tail(self) -> List[dict]:
+        """ Return the complete records past `offset`, appended by other
+        processes since this one last read or wrote the journal, and move
+        `offset` after them
+        """
+        records = []
+        if not os.path.exists(self.file_path):
+            return records
+        with open(self.file_path, 'rb') as f:
+            f.seek(self.offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                self.offset += len(line)
+                records.append(record)
+        self.count += len(records)
+        return records
+
+    def reset(self):
+        """ Empty the journal, once its records are part of a snapshot
+        """
+        with open(self.file_path, 'w') as f:
+            f.flush()
+            os.fsync(f.fileno())
+        self.count = 0
+        self.offset = 0
+
+
+class FileLock():
+    """ Exclusive `flock` on a lock file, which serializes processes
+
+    The lock is re-entrant within a process. `flock` locks belong to an
+    open file, not to a thread: callers serialize their own threads.
+    """
+
+    def __init__(self, file_path: str):
+        """ Initialize a FileLock on `file_path`, not acquired yet
+        """
+        self.file_path = file_path
+        self.fd = None
+        self.pid = None
+        self.depth = 0
+
+    def __enter__(self):
+        """ Acquire the lock, waiting for other processes to release it
+        """
+        if self.pid != os.getpid():
+            # a descriptor inherited through fork() shares the parent's
+            # lock instead of competing for it
+            self.fd = os.open(self.file_path, os.O_RDWR | os.O_CREAT, 0o644)
+            self.pid = os.getpid()
+            self.depth = 0
+        if self.depth == 0:
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+        self.depth += 1
+        return self
+
+    def __exit__(self, *args):
+        """ Release the lock once the outermost holder exits
+        """
+        self.depth -= 1
+        if self.depth == 0:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+
+class Flusher(threading.Thread):
+    """ Background thread running `flush` every `interval` seconds, or
+    as soon as it is woken up
+    """
+
+    def __init__(self, flush: Callable[[], None], interval: float,
+                 name: str = "db-flusher"):
+        """ Initialize a Flusher, not started yet
+        """
+        super().__init__(name=name, daemon=True)
+        self.flush = flush
+        self.interval = interval
+        self.wakeup = threading.Event()
+
+    def run(self):
+        """ Flush until the process exits
+        """
+        while True:
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logging.getLogger(__name__).exception("Flush failed")
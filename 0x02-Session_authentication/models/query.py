@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+""" Query module
+
+Planner of `Base.query`. A query is a list of `(attribute, operator,
+value)` conditions that must all hold, plus an optional ordering.
+"""
+import operator
+from typing import Iterable, List, Tuple
+
+from models.index import HashIndex, SortedIndex
+
+
+OPERATORS = {
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+}
+
+
+def matches(obj, conditions: Iterable[Tuple[str, str, object]]) -> bool:
+    """ Tell whether an object meets every condition
+
+    Like `Base.search`, equality reads the attribute strictly; other
+    comparisons are simply false on a missing, None or incomparable value.
+    """
+    for attribute, op, value in conditions:
+        if op == '==':
+            if getattr(obj, attribute) != value:
+                return False
+            continue
+        current = getattr(obj, attribute, None)
+        try:
+            if current is None or not OPERATORS[op](current, value):
+                return False
+        except TypeError:
+            return False
+    return True
+
+
+def _range(conditions: Iterable[Tuple[str, str, object]],
+           attribute: str) -> tuple:
+    """ Narrowest `(low, high, low_inclusive, high_inclusive)` the
+    conditions put on `attribute`, or None if they put none
+    """
+    low = high = None
+    low_inclusive = high_inclusive = True
+    for name, op, value in conditions:
+        if name != attribute or value is None:
+            continue
+        if op in ('==', '>', '>='):
+            inclusive = op != '>'
+            if low is None or value > low or \
+                    (value == low and not inclusive):
+                low, low_inclusive = value, inclusive
+        if op in ('==', '<', '<='):
+            inclusive = op != '<'
+            if high is None or value < high or \
+                    (value == high and not inclusive):
+                high, high_inclusive = value, inclusive
+    if low is None and high is None:
+        return None
+    return low, high, low_inclusive, high_inclusive
+
+
+class Plan():
+    """ Access path of a query: one index, or a scan of the whole class
+    """
+
+    def __init__(self, total: int, order_by: str = None,
+                 descending: bool = False):
+        """ Initialize a full scan plan over `total` objects
+        """
+        self.total = total
+        self.order_by = order_by
+        self.descending = descending
+        self.index = None
+        self.value = None
+        self.bounds = None
+        self.estimate = total
+
+    @property
+    def ordered(self) -> bool:
+        """ Whether candidates come out in the requested order already
+        """
+        if self.order_by is None:
+            return True
+        return isinstance(self.index, SortedIndex) and \
+            self.index.attribute == self.order_by
+
+    def candidates(self) -> List[str]:
+        """ IDs to check against the conditions, None for a full scan
+        """
+        if isinstance(self.index, HashIndex):
+            return self.index.lookup(self.value)
+        if isinstance(self.index, SortedIndex):
+            bounds = self.bounds or (None, None, True, True)
+            return self.index.between(*bounds,
+                                      reverse=self.ordered and self.descending)
+        return None
+
+    def explain(self) -> dict:
+        """ Describe the plan
+        """
+        access = {'type': 'scan'}
+        if isinstance(self.index, HashIndex):
+            access = {'type': 'hash', 'attribute': self.index.attribute,
+                      'value': self.value}
+        elif isinstance(self.index, SortedIndex):
+            low, high, low_inclusive, high_inclusive = \
+                self.bounds or (None, None, True, True)
+            access = {'type': 'sorted', 'attribute': self.index.attribute,
+                      'low': low, 'high': high,
+                      'low_inclusive': low_inclusive,
+                      'high_inclusive': high_inclusive}
+        return {
+            'access': access,
+            'estimated_rows': self.estimate,
+            'total_rows': self.total,
+            'sort': None if self.ordered else self.order_by,
+        }
+
+
+def plan(conditions: List[Tuple[str, str, object]], indexes: dict,
+         total: int, order_by: str = None,
+         descending: bool = False) -> Plan:
+    """ Pick the index returning the fewest candidates for the conditions
+
+    Hash indexes answer `==` with an exact count, sorted indexes answer
+    `==` and ranges with two bisects. On a tie, the index that also gives
+    the requested order wins. Without a usable index, a query ordered by
+    a sorted attribute walks that index instead of sorting a scan.
+    """
+    best = Plan(total, order_by, descending)
+    for attribute, index in indexes.items():
+        candidate = Plan(total, order_by, descending)
+        candidate.index = index
+        try:
+            if isinstance(index, HashIndex):
+                values = [v for a, op, v in conditions
+                          if a == attribute and op == '==']
+                if len(values) == 0:
+                    continue
+                candidate.value = values[0]
+                candidate.estimate = index.count(values[0])
+            else:
+                candidate.bounds = _range(conditions, attribute)
+                if candidate.bounds is None:
+                    continue
+                start, end = index.span(*candidate.bounds)
+                candidate.estimate = end - start
+        except TypeError:
+            # unhashable or incomparable values are not indexed
+            continue
+        if candidate.estimate < best.estimate or \
+                (candidate.estimate == best.estimate and
+                 candidate.ordered and not best.ordered):
+            best = candidate
+    if best.index is None and not best.ordered and \
+            isinstance(indexes.get(order_by), SortedIndex):
+        best.index = indexes[order_by]
+    return best
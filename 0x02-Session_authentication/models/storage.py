@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+""" Storage module
+
+Storage engines of `models.base.Base`: `DB_STORAGE` selects one,
+`json` (default, `models.json_storage.JSONStorage`) or `sqlite`
+(`SQLiteStorage`).
+"""
+from datetime import datetime
+import sqlite3
+import threading
+from typing import Iterable, List, Tuple, TypeVar
+
+from models.base import TIMESTAMP_FORMAT, _fields
+from models.query import OPERATORS
+
+
+class Storage():
+    """ Interface of a storage engine
+
+    Each method receives the model class (or instance) it works on and
+    mirrors the `Base` method of the same name.
+    """
+
+    def load(self, cls: type, lazy: bool = None):
+        """ Prepare the storage of `cls`, loading it if it lives in memory
+        """
+        raise NotImplementedError()
+
+    def compact(self, cls: type):
+        """ Rewrite the storage of `cls` in its most compact form
+        """
+
+    def sync(self, cls: type):
+        """ Catch up with the changes other processes made to `cls`
+        """
+
+    def flush(self):
+        """ Write every mutation still held in memory
+        """
+
+    def memory_only(self) -> bool:
+        """ Tell whether reads are answered from memory alone, without
+        any I/O
+        """
+        return False
+
+    def revision(self, cls: type) -> int:
+        """ Return a counter bumped by every change to the objects of `cls`
+        """
+        raise NotImplementedError()
+
+    def update_attribute(self, obj: TypeVar('Base'), name: str, value):
+        """ Set an indexed attribute of `obj`
+        """
+        object.__setattr__(obj, name, value)
+
+    def save_many(self, cls: type, objs: Iterable[TypeVar('Base')]):
+        """ Insert or update several objects of `cls` at once
+        """
+        raise NotImplementedError()
+
+    def remove_many(self, cls: type, objs: Iterable[TypeVar('Base')]):
+        """ Delete several objects of `cls` at once
+        """
+        raise NotImplementedError()
+
+    def count(self, cls: type) -> int:
+        """ Count the objects of `cls`
+        """
+        raise NotImplementedError()
+
+    def page(self, cls: type, limit: int = None,
+             after: str = None) -> List[TypeVar('Base')]:
+        """ Return up to `limit` objects of `cls` ordered by ID, after the
+        ID `after`
+        """
+        raise NotImplementedError()
+
+    def get(self, cls: type, obj_id: str) -> TypeVar('Base'):
+        """ Return one object of `cls` by ID, or None
+        """
+        raise NotImplementedError()
+
+    def search(self, cls: type,
+               attributes: dict) -> List[TypeVar('Base')]:
+        """ Return the objects of `cls` whose attributes all match
+        """
+        return self.query(cls, [(k, '==', v) for k, v in attributes.items()])
+
+    def query(self, cls: type,
+              conditions: Iterable[Tuple[str, str, object]] = None,
+              order_by: str = None, descending: bool = False,
+              limit: int = None) -> List[TypeVar('Base')]:
+        """ Return up to `limit` objects of `cls` meeting every condition,
+        ordered by `order_by`
+        """
+        raise NotImplementedError()
+
+    def explain(self, cls: type,
+                conditions: Iterable[Tuple[str, str, object]] = None,
+                order_by: str = None, descending: bool = False) -> dict:
+        """ Describe how `query` would run
+        """
+        raise NotImplementedError()
+
+
+class SQLiteStorage(Storage):
+    """ Storage engine keeping one SQLite table per model class
+
+    Every attribute is a column, `indexed_attributes` and
+    `sorted_attributes` get an SQL index,
+    and each save/remove writes a single row. Connections are per thread.
+
+    The `_revisions` table counts the transactions that changed each
+    class, for `Base.revision()`: processes sharing the database see each
+    other's.
+    """
+
+    def __init__(self, file_path: str, synchronous: str = "FULL"):
+        """ Initialize a SQLiteStorage on the database at `file_path`
+        """
+        self.file_path = file_path
+        self.synchronous = synchronous
+        self.local = threading.local()
+        self.columns = {}
+        self.lock = threading.Lock()
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """ Connection of the current thread
+        """
+        conn = getattr(self.local, 'connection', None)
+        if conn is None:
+            conn = sqlite3.connect(self.file_path, isolation_level=None,
+                                   timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous={}".format(self.synchronous))
+            self.local.connection = conn
+        return conn
+
+    def _table(self, cls: type) -> str:
+        """ Quoted table name of `cls`, creating the table if needed
+        """
+        s_class = cls.__name__
+        if s_class not in self.columns:
+            with self.lock:
+                self._create_table(cls)
+        return '"{}"'.format(s_class)
+
+    def _create_table(self, cls: type):
+        """ Create the table and indexes of `cls`, and read its columns
+        """
+        s_class = cls.__name__
+        conn = self.connection
+        columns = [name for name in _fields(cls) if name != 'id']
+        conn.execute('CREATE TABLE IF NOT EXISTS "{}" ('
+                     'id TEXT PRIMARY KEY{})'.format(
+                         s_class,
+                         "".join(', "{}"'.format(c) for c in columns)))
+        for attribute in cls.indexed_attributes + tuple(
+                a for a in cls.sorted_attributes if a != 'id'):
+            conn.execute(
+                'CREATE INDEX IF NOT EXISTS "{0}_{1}" ON "{0}" ("{1}")'
+                .format(s_class, attribute))
+        conn.execute('CREATE TABLE IF NOT EXISTS "_revisions" ('
+                     'name TEXT PRIMARY KEY, revision INTEGER NOT NULL)')
+        rows = conn.execute('PRAGMA table_info("{}")'.format(s_class))
+        self.columns[s_class] = [row['name'] for row in rows]
+
+    def _ensure_columns(self, cls: type, names: Iterable[str]):
+        """ Add the columns `names` that the table of `cls` lacks
+        """
+        s_class = cls.__name__
+        self._table(cls)
+        missing = [n for n in names if n not in self.columns[s_class]]
+        if len(missing) == 0:
+            return
+        with self.lock:
+            for name in missing:
+                if name in self.columns[s_class]:
+                    continue
+                self.connection.execute(
+                    'ALTER TABLE "{}" ADD COLUMN "{}"'.format(s_class, name))
+                self.columns[s_class].append(name)
+
+    def _build(self, cls: type, row: sqlite3.Row) -> TypeVar('Base'):
+        """ Build an instance of `cls` out of a row
+        """
+        return cls(**dict(row))
+
+    def revision(self, cls: type) -> int:
+        """ Return the number of transactions that changed `cls`
+        """
+        self._table(cls)
+        row = self.connection.execute(
+            'SELECT revision FROM "_revisions" WHERE name = ?',
+            (cls.__name__,)).fetchone()
+        return 0 if row is None else row[0]
+
+    def _revise(self, classes: Iterable[type]):
+        """ Bump the revision of `classes`, in the current transaction
+        """
+        for cls in classes:
+            self.connection.execute(
+                'INSERT INTO "_revisions" VALUES (?, 1) ON CONFLICT(name) '
+                'DO UPDATE SET revision = revision + 1', (cls.__name__,))
+
+    def load(self, cls: type, lazy: bool = None):
+        """ Prepare the table of `cls`: there is nothing to load in memory
+        """
+        self._table(cls)
+
+    def save(self, obj: TypeVar('Base')):
+        """ Upsert the row of `obj`, keeping its original row order
+        """
+        cls = obj.__class__
+        record = obj.to_json(True)
+        self._ensure_columns(cls, record.keys())
+        names = list(record.keys())
+        self.connection.execute(
+            'INSERT INTO {} ({}) VALUES ({}) '
+            'ON CONFLICT(id) DO UPDATE SET {}'.format(
+                self._table(cls),
+                ", ".join('"{}"'.format(n) for n in names),
+                ", ".join("?" for _ in names),
+                ", ".join('"{0}"=excluded."{0}"'.format(n)
+                          for n in names if n != 'id')),
+            [record[n] for n in names])
+
+    def save_many(self, cls: type, objs: Iterable[TypeVar('Base')]):
+        """ Upsert several rows in a single transaction
+        """
+        conn = self.connection
+        conn.execute("BEGIN")
+        try:
+            for obj in objs:
+                self.save(obj)
+            self._revise([cls])
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def remove(self, obj: TypeVar('Base')):
+        """ Delete the row of `obj`
+        """
+        self.connection.execute(
+            'DELETE FROM {} WHERE id = ?'.format(self._table(obj.__class__)),
+            (obj.id,))
+
+    def remove_many(self, cls: type, objs: Iterable[TypeVar('Base')]):
+        """ Delete several rows in a single transaction
+        """
+        conn = self.connection
+        conn.execute("BEGIN")
+        try:
+            for obj in objs:
+                self.remove(obj)
+            self._revise([cls])
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def count(self, cls: type) -> int:
+        """ Count the rows of `cls`
+        """
+        cursor = self.connection.execute(
+            'SELECT COUNT(*) FROM {}'.format(self._table(cls)))
+        return cursor.fetchone()[0]
+
+    def page(self, cls: type, limit: int = None,
+             after: str = None) -> List[TypeVar('Base')]:
+        """ Return up to `limit` objects of `cls` ordered by ID (the
+        primary key), after the ID `after`
+        """
+        where = "" if after is None else " WHERE id > ?"
+        params = [] if after is None else [after]
+        cursor = self.connection.execute(
+            'SELECT * FROM {}{} ORDER BY id LIMIT ?'.format(
+                self._table(cls), where),
+            params + [-1 if limit is None else limit])
+        return [self._build(cls, row) for row in cursor]
+
+    def get(self, cls: type, obj_id: str) -> TypeVar('Base'):
+        """ Return the object of `cls` with ID `obj_id`, or None
+        """
+        cursor = self.connection.execute(
+            'SELECT * FROM {} WHERE id = ?'.format(self._table(cls)),
+            (obj_id,))
+        row = cursor.fetchone()
+        return None if row is None else self._build(cls, row)
+
+    def search(self, cls: type,
+               attributes: dict) -> List[TypeVar('Base')]:
+        """ Return the objects of `cls` matching every attribute, in
+        insertion order
+        """
+        table = self._table(cls)
+        s_class = cls.__name__
+        clauses, params = [], []
+        for k, v in attributes.items():
+            if k not in self.columns[s_class]:
+                raise AttributeError(
+                    "'{}' object has no attribute '{}'".format(s_class, k))
+            if type(v) is datetime:
+                v = v.strftime(TIMESTAMP_FORMAT)
+            clauses.append('"{}" IS ?'.format(k))
+            params.append(v)
+        where = " WHERE " + " AND ".join(clauses) if clauses else ""
+        cursor = self.connection.execute(
+            'SELECT * FROM {}{} ORDER BY rowid'.format(table, where), params)
+        return [self._build(cls, row) for row in cursor]
+
+    def _select(self, cls: type,
+                conditions: Iterable[Tuple[str, str, object]],
+                order_by: str, descending: bool,
+                limit: int) -> Tuple[str, list]:
+        """ SQL and parameters of a query
+        """
+        table = self._table(cls)
+        columns = self.columns[cls.__name__]
+        clauses, params = [], []
+        for attribute, op, value in conditions or ():
+            if op not in OPERATORS:
+                raise ValueError("Unknown operator: {}".format(op))
+            if attribute not in columns:
+                raise AttributeError("'{}' object has no attribute '{}'"
+                                     .format(cls.__name__, attribute))
+            if type(value) is datetime:
+                # TIMESTAMP_FORMAT strings sort like the datetimes
+                value = value.strftime(TIMESTAMP_FORMAT)
+            if op == '==':
+                op = 'IS'
+            elif op == '!=':
+                op = 'IS NOT'
+            clauses.append('"{}" {} ?'.format(attribute, op))
+            params.append(value)
+        sql = 'SELECT * FROM {}'.format(table)
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        if order_by is not None:
+            if order_by not in columns:
+                raise AttributeError("'{}' object has no attribute '{}'"
+                                     .format(cls.__name__, order_by))
+            sql += ' ORDER BY "{}" IS NULL, "{}"{}'.format(
+                order_by, order_by, " DESC" if descending else "")
+        else:
+            sql += " ORDER BY rowid"
+        sql += " LIMIT ?"
+        params.append(-1 if limit is None else limit)
+        return sql, params
+
+    def query(self, cls: type,
+              conditions: Iterable[Tuple[str, str, object]] = None,
+              order_by: str = None, descending: bool = False,
+              limit: int = None) -> List[TypeVar('Base')]:
+        """ Return up to `limit` objects of `cls` meeting every condition,
+        ordered by `order_by` (insertion order by default)
+        """
+        sql, params = self._select(cls, conditions, order_by, descending,
+                                   limit)
+        cursor = self.connection.execute(sql, params)
+        return [self._build(cls, row) for row in cursor]
+
+    def explain(self, cls: type,
+                conditions: Iterable[Tuple[str, str, object]] = None,
+                order_by: str = None, descending: bool = False) -> dict:
+        """ Describe the query with SQLite's `EXPLAIN QUERY PLAN`
+        """
+        sql, params = self._select(cls, conditions, order_by, descending,
+                                   None)
+        cursor = self.connection.execute("EXPLAIN QUERY PLAN " + sql, params)
+        return {'sql': sql, 'plan': [row['detail'] for row in cursor]}
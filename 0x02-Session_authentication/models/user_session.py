@@ -3,14 +3,23 @@
 
 Provides functionality for user sessions.
 """
+import sys
+
 from models.base import Base
 
 
 class UserSession(Base):
     """User Session Class"""
 
+    __slots__ = ('user_id', 'session_id')
+    indexed_attributes = ('session_id', 'user_id')
+
     def __init__(self, *args: list, **kwargs: dict):
         """Initialize UserSession instance."""
         super().__init__(*args, **kwargs)
-        self.user_id = kwargs.get('user_id')
+        user_id = kwargs.get('user_id')
+        if type(user_id) is str:
+            # one string per user, however many sessions it has
+            user_id = sys.intern(user_id)
+        self.user_id = user_id
         self.session_id = kwargs.get('session_id')
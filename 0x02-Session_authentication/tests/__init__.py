@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+""" Tests of the models
+
+Run from this project's directory: `python3 -m unittest discover tests`
+(or `python3 -m pytest tests`).
+"""
+import os
+import tempfile
+import unittest
+
+from models import json_storage
+
+
+class StoreTestCase(unittest.TestCase):
+    """ Runs each test in an empty store, in a temporary directory
+    """
+
+    def setUp(self):
+        """ Move to an empty directory and forget every loaded class
+        """
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        for registry in (json_storage.DATA, json_storage.INDEXES,
+                         json_storage.JOURNALS, json_storage.VERSIONS,
+                         json_storage.REVISIONS, json_storage.PENDING):
+            registry.clear()
+
+    def tearDown(self):
+        """ Go back to the original directory
+        """
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
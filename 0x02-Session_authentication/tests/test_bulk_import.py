@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+""" Tests of the bulk import of users
+"""
+from datetime import datetime
+import json
+import unittest
+from unittest import mock
+
+from models import base
+from models.bulk_import import bulk_import
+from models.user import User
+from tests import StoreTestCase
+
+
+class TestBulkImport(StoreTestCase):
+    """ Invalid lines are skipped, valid ones imported as given
+    """
+
+    def write(self, lines: list) -> str:
+        """ Write a JSON lines file, return its path
+        """
+        with open('users.jsonl', 'w') as f:
+            for line in lines:
+                f.write(line + '\n')
+        return 'users.jsonl'
+
+    def test_invalid_lines(self):
+        """ Malformed and non-object lines are skipped, not fatal
+        """
+        file_path = self.write([
+            json.dumps({'email': 'a@hbtn.io', 'password': 'pwd'}),
+            '{"email": ',
+            '[1]',
+            '"b@hbtn.io"',
+            json.dumps({'email': 'c@hbtn.io', 'password': 'pwd'}),
+        ])
+        with mock.patch('sys.stderr'):
+            report = bulk_import(file_path, 1)
+        self.assertEqual((report['imported'], report['skipped']), (2, 3))
+        self.assertEqual(sorted(u.email for u in User.all()),
+                         ['a@hbtn.io', 'c@hbtn.io'])
+
+    def test_timestamps(self):
+        """ Timestamps are kept, and parsed only once, by validation
+        """
+        file_path = self.write([json.dumps({
+            'id': 'u1', 'email': 'a@hbtn.io', 'password': 'pwd',
+            'created_at': '2020-01-02T03:04:05',
+            'updated_at': '2021-01-02T03:04:05',
+        })])
+        with mock.patch.object(base, '_parse_timestamp',
+                               side_effect=AssertionError):
+            report = bulk_import(file_path)
+        self.assertEqual(report['imported'], 1)
+        user = User.get('u1')
+        self.assertEqual(user.created_at, datetime(2020, 1, 2, 3, 4, 5))
+        self.assertEqual(user.updated_at, datetime(2021, 1, 2, 3, 4, 5))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+""" Tests of the secondary indexes and of their maintenance by Base
+"""
+import unittest
+
+from models.base import storage
+from models.json_storage import DATA
+from models.index import HashIndex, SortedIndex
+from models.user import User
+from tests import StoreTestCase
+
+
+def scan(cls, attributes: dict) -> list:
+    """ IDs of the stored objects matching `attributes`, without indexes
+    """
+    return [
+        obj.id for obj in DATA[cls.__name__].values()
+        if all(getattr(obj, k) == v for k, v in attributes.items())
+    ]
+
+
+class TestHashIndex(unittest.TestCase):
+    """ HashIndex on its own
+    """
+
+    def test_shared_values(self):
+        """ A value shared by several IDs keeps them in insertion order,
+        and goes back to a single ID when the others leave
+        """
+        index = HashIndex('email')
+        index.add('b', 'x')
+        index.add('a', 'x')
+        index.add('a', 'x')
+        self.assertEqual(index.lookup('x'), ['b', 'a'])
+        self.assertEqual(index.count('x'), 2)
+        index.discard('b', 'x')
+        self.assertEqual(index.lookup('x'), ['a'])
+        index.discard('a', 'x')
+        self.assertEqual(index.lookup('x'), [])
+        self.assertEqual(index.entries, {})
+
+    def test_unhashable(self):
+        """ Unhashable values are not indexed, lookups on them raise
+        """
+        index = HashIndex('tags')
+        index.add('a', ['x'])
+        index.discard('a', ['x'])
+        self.assertEqual(index.entries, {})
+        with self.assertRaises(TypeError):
+            index.lookup(['x'])
+
+
+class TestSortedIndex(unittest.TestCase):
+    """ SortedIndex on its own
+    """
+
+    def test_duplicate_values(self):
+        """ Equal values come out in ID order, bounds include or exclude
+        all of them
+        """
+        index = SortedIndex('n')
+        for obj_id, value in (('c', 2), ('a', 2), ('b', 1), ('d', 3),
+                              ('e', 2)):
+            index.add(obj_id, value)
+        self.assertEqual(index.lookup(2), ['a', 'c', 'e'])
+        self.assertEqual(index.between(2, None), ['a', 'c', 'e', 'd'])
+        self.assertEqual(index.between(2, None, low_inclusive=False), ['d'])
+        self.assertEqual(index.between(None, 2, high_inclusive=False),
+                         ['b'])
+        self.assertEqual(index.between(1, 2, reverse=True),
+                         ['e', 'c', 'a', 'b'])
+        self.assertEqual(index.between(4, None), [])
+        self.assertEqual(index.between(3, 1), [])
+        index.discard('c', 2)
+        index.discard('c', 2)
+        self.assertEqual(index.lookup(2), ['a', 'e'])
+
+    def test_none_and_incomparable(self):
+        """ None and incomparable values are not indexed
+        """
+        index = SortedIndex('n')
+        index.add('a', 1)
+        index.add('b', None)
+        index.add('c', 'text')
+        self.assertEqual(index.between(), ['a'])
+        with self.assertRaises(TypeError):
+            index.lookup(None)
+
+    def test_after(self):
+        """ Cursor pagination of an `id` index
+        """
+        index = SortedIndex('id')
+        for obj_id in ('d', 'b', 'a', 'c'):
+            index.add(obj_id, obj_id)
+        self.assertEqual(index.after(None, 2), ['a', 'b'])
+        self.assertEqual(index.after('b', 2), ['c', 'd'])
+        self.assertEqual(index.after('d', 2), [])
+        self.assertEqual(index.after('z', 2), [])
+        # a cursor removed since, or never indexed, still resumes after it
+        self.assertEqual(index.after('bb', 5), ['c', 'd'])
+        self.assertEqual(index.after('', 1), ['a'])
+        self.assertEqual(index.after('a'), ['b', 'c', 'd'])
+
+    def test_deferred(self):
+        """ Keys added and removed while deferred land like immediate ones
+        """
+        immediate = SortedIndex('n')
+        deferred = SortedIndex('n', deferred=True)
+        deferred.add('x', 0)
+        deferred.sort()
+        immediate.add('x', 0)
+        deferred.defer()
+        for obj_id, value in (('a', 3), ('b', 1), ('c', 2), ('d', 1)):
+            immediate.add(obj_id, value)
+            deferred.add(obj_id, value)
+        for obj_id, value in (('c', 2), ('x', 0)):
+            immediate.discard(obj_id, value)
+            deferred.discard(obj_id, value)
+        # readers keep seeing the keys of the last sort() meanwhile
+        self.assertEqual(deferred.between(), ['x'])
+        deferred.sort()
+        self.assertEqual(deferred.keys, immediate.keys)
+        self.assertEqual(deferred.between(), ['b', 'd', 'a'])
+
+
+class TestIndexMaintenance(StoreTestCase):
+    """ Indexed searches of Base against a scan, as objects change
+    """
+
+    def setUp(self):
+        """ Load an empty User store with a few users
+        """
+        super().setUp()
+        User.load_from_file()
+        self.users = []
+        for i in range(6):
+            user = User(email='user{}@hbtn.io'.format(i % 4),
+                        first_name='First{}'.format(i % 2))
+            user.save()
+            self.users.append(user)
+
+    def assertSearchesMatchScan(self):
+        """ Every email and ID searched through the indexes finds what a
+        scan finds
+        """
+        values = {u.email for u in DATA['User'].values()}
+        for email in values | {'nobody@hbtn.io'}:
+            self.assertEqual(
+                sorted(u.id for u in User.search({'email': email})),
+                sorted(scan(User, {'email': email})))
+        for user in self.users:
+            self.assertEqual([u.id for u in User.search({'id': user.id})],
+                             scan(User, {'id': user.id}))
+        self.assertEqual(sorted(storage().indexes(User)['id'].between()),
+                         sorted(DATA['User']))
+
+    def test_save(self):
+        """ Saved objects are found through the indexes
+        """
+        self.assertSearchesMatchScan()
+        self.assertEqual(len(User.search({'email': 'user1@hbtn.io'})), 2)
+
+    def test_attribute_change(self):
+        """ Changing an indexed attribute of a stored object moves it in
+        the index, before it is even saved
+        """
+        user = self.users[1]
+        user.email = 'changed@hbtn.io'
+        self.assertEqual(User.search({'email': 'user1@hbtn.io'}),
+                         [self.users[5]])
+        self.assertEqual(User.search({'email': 'changed@hbtn.io'}), [user])
+        user.save()
+        self.assertSearchesMatchScan()
+
+    def test_remove(self):
+        """ Removed objects leave every index
+        """
+        self.users[0].remove()
+        User.bulk_remove(self.users[2:4])
+        self.assertEqual(User.search({'email': 'user0@hbtn.io'}),
+                         [self.users[4]])
+        self.assertEqual(User.search({'id': self.users[2].id}), [])
+        self.assertSearchesMatchScan()
+
+    def test_reload(self):
+        """ Indexes rebuilt from the snapshot and journal match a scan
+        """
+        self.users[1].email = 'changed@hbtn.io'
+        self.users[1].save()
+        self.users[0].remove()
+        User.save_to_file()
+        self.users[2].remove()
+        User.load_from_file()
+        self.users = [u for u in self.users if u.id in DATA['User']]
+        self.assertEqual(len(self.users), 4)
+        self.assertEqual(len(User.search({'email': 'changed@hbtn.io'})), 1)
+        self.assertSearchesMatchScan()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+""" Tests of Base.query and of its planner, against a full scan
+"""
+from datetime import datetime, timedelta
+import random
+import unittest
+
+from models.json_storage import DATA
+from models.query import matches
+from models.user import User
+from tests import StoreTestCase
+
+
+def scan(conditions: list, order_by: str = None, descending: bool = False,
+         limit: int = None) -> list:
+    """ IDs `User.query` should return, from a scan of every user
+    """
+    # timestamps given as strings are parsed like `query` does
+    conditions = User._conditions(conditions)
+    found = [u for u in DATA['User'].values() if matches(u, conditions)]
+    if order_by is not None:
+        found.sort(key=lambda u: getattr(u, order_by), reverse=descending)
+    return [u.id for u in found][:limit]
+
+
+class TestQuery(StoreTestCase):
+    """ Indexed queries return what a scan returns
+    """
+
+    def setUp(self):
+        """ Store 200 users with distinct creation times and repeated
+        emails and first names
+        """
+        super().setUp()
+        User.load_from_file()
+        rng = random.Random(12)
+        start = datetime(2024, 1, 1)
+        seconds = rng.sample(range(100000), 200)
+        User.bulk_create([
+            {'email': 'user{}@hbtn.io'.format(rng.randrange(40)),
+             'first_name': rng.choice(['Ann', 'Bob', None]),
+             'created_at': (start + timedelta(seconds=s)).strftime(
+                 '%Y-%m-%dT%H:%M:%S')}
+            for s in seconds
+        ])
+        self.times = sorted(u.created_at for u in DATA['User'].values())
+        self.ids = sorted(DATA['User'])
+
+    def assertQueryMatchesScan(self, conditions: list, order_by: str = None,
+                               descending: bool = False, limit: int = None):
+        """ Compare a query with the scan, in order when it is ordered
+        """
+        found = [u.id for u in User.query(conditions, order_by, descending,
+                                          limit)]
+        expected = scan(conditions, order_by, descending, limit)
+        if order_by is None and limit is None:
+            self.assertEqual(sorted(found), sorted(expected), conditions)
+        else:
+            self.assertEqual(found, expected, (conditions, order_by))
+
+    def test_equality(self):
+        """ Equality on hash, sorted and unindexed attributes
+        """
+        self.assertQueryMatchesScan([('email', '==', 'user3@hbtn.io')])
+        self.assertQueryMatchesScan([('email', '==', 'nobody@hbtn.io')])
+        self.assertQueryMatchesScan([('id', '==', self.ids[7])])
+        self.assertQueryMatchesScan([('first_name', '==', 'Ann')])
+        self.assertQueryMatchesScan([('first_name', '==', None)])
+        self.assertQueryMatchesScan([('email', '==', 'user3@hbtn.io'),
+                                     ('first_name', '!=', 'Bob')])
+
+    def test_ranges(self):
+        """ Ranges, open or closed, empty or inverted
+        """
+        low, high = self.times[50], self.times[120]
+        for conditions in (
+                [('created_at', '>=', low)],
+                [('created_at', '>', low)],
+                [('created_at', '<', high)],
+                [('created_at', '>', low), ('created_at', '<=', high)],
+                [('created_at', '>', high), ('created_at', '<', low)],
+                [('created_at', '>', self.times[-1])],
+                [('created_at', '>=', '2024-01-01T10:00:00')],
+                [('id', '>', self.ids[150]), ('email', '!=', 'x')],
+                [('created_at', '>=', low), ('first_name', '==', 'Bob')],
+        ):
+            self.assertQueryMatchesScan(conditions)
+            self.assertQueryMatchesScan(conditions, 'created_at')
+            self.assertQueryMatchesScan(conditions, 'created_at', True, 7)
+            self.assertQueryMatchesScan(conditions, 'id', limit=5)
+
+    def test_order_and_limit(self):
+        """ Ordering with or without conditions, limit past the end
+        """
+        self.assertQueryMatchesScan([], 'created_at')
+        self.assertQueryMatchesScan([], 'created_at', True, 10)
+        self.assertQueryMatchesScan([], 'id', limit=1000)
+        self.assertQueryMatchesScan([('email', '==', 'user5@hbtn.io')],
+                                    'created_at', True)
+
+    def test_changes(self):
+        """ Results follow saves, attribute changes and removals
+        """
+        users = User.query([], 'created_at', limit=30)
+        for user in users[:10]:
+            user.remove()
+        for i, user in enumerate(users[10:20]):
+            user.email = 'moved@hbtn.io'
+            user.created_at = self.times[-1] + timedelta(days=1, seconds=-i)
+            user.save()
+        self.assertQueryMatchesScan([('email', '==', 'moved@hbtn.io')],
+                                    'created_at')
+        self.assertQueryMatchesScan([('created_at', '>', self.times[-1])])
+        self.assertQueryMatchesScan([('created_at', '<=', self.times[25])],
+                                    'created_at')
+
+    def test_plan(self):
+        """ The planner reads the most selective index, and never
+        estimates more rows than a scan
+        """
+        total = len(DATA['User'])
+        email = 'user3@hbtn.io'
+        plan = User.explain([('email', '==', email),
+                             ('created_at', '>=', self.times[0])])
+        self.assertEqual(plan['access']['type'], 'hash')
+        self.assertEqual(plan['estimated_rows'],
+                         len(scan([('email', '==', email)])))
+        plan = User.explain([('email', '==', email),
+                             ('created_at', '>', self.times[-3])])
+        self.assertEqual(plan['access']['attribute'], 'created_at')
+        self.assertEqual(plan['estimated_rows'], 2)
+        plan = User.explain([('first_name', '==', 'Ann')])
+        self.assertEqual(plan['access'], {'type': 'scan'})
+        self.assertEqual(plan['estimated_rows'], total)
+        plan = User.explain([('first_name', '==', 'Ann')], 'created_at')
+        self.assertEqual(plan['access']['attribute'], 'created_at')
+        self.assertIsNone(plan['sort'])
+        plan = User.explain([('first_name', '==', 'Ann')], 'first_name')
+        self.assertEqual(plan['sort'], 'first_name')
+        with self.assertRaises(ValueError):
+            User.query([('email', '~', 'x')])
+
+
+if __name__ == "__main__":
+    unittest.main()
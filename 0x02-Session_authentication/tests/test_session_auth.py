@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+""" Tests of the in-memory session authentications: durable logouts,
+and composite session types
+"""
+import os
+import stat
+import unittest
+from unittest import mock
+
+from flask import Request
+
+from api.v1.auth.composite_auth import CompositeAuth
+from api.v1.auth.session_auth import SessionAuth
+from api.v1.auth.session_exp_auth import SessionExpAuth
+from models.user import User
+from tests import StoreTestCase
+
+SESSION_NAME = '_my_session_id'
+
+
+def request(session_id: str) -> Request:
+    """ A request carrying a session cookie
+    """
+    return Request.from_values(
+        headers={'Cookie': '{}={}'.format(SESSION_NAME, session_id)})
+
+
+class SessionTestCase(StoreTestCase):
+    """ Session maps start empty, snapshots are taken by the tests
+    """
+
+    def setUp(self):
+        """ Snapshot settings of the tests, empty session maps
+        """
+        super().setUp()
+        patches = [
+            mock.patch.dict(os.environ, {
+                'SESSION_NAME': SESSION_NAME,
+                'SESSION_SNAPSHOT_INTERVAL': '3600',
+            }),
+            mock.patch.object(SessionAuth, 'start_snapshots'),
+            mock.patch.dict(SessionAuth.user_id_by_session_id, clear=True),
+            mock.patch.dict(SessionExpAuth.user_id_by_session_id,
+                            clear=True),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.user = User(email='bob@hbtn.io')
+        self.user.password = 'pwd'
+        self.user.save()
+
+
+class TestLogout(SessionTestCase):
+    """ A logout survives a crash before the next snapshot
+    """
+
+    def restart(self, cls: type) -> SessionAuth:
+        """ A new instance of `cls` restoring the snapshot, as after a
+        crash: no snapshot was taken at exit
+        """
+        cls.user_id_by_session_id.clear()
+        auth = cls()
+        auth.restore_sessions()
+        return auth
+
+    def test_logout(self):
+        """ Sessions destroyed after the snapshot are not restored
+        """
+        for cls in (SessionAuth, SessionExpAuth):
+            auth = cls()
+            kept = auth.create_session(self.user.id)
+            gone = auth.create_session(self.user.id)
+            auth.save_sessions()
+            self.assertTrue(auth.destroy_session(request(gone)))
+
+            auth = self.restart(cls)
+            self.assertEqual(auth.user_id_for_session_id(kept), self.user.id)
+            self.assertIsNone(auth.user_id_for_session_id(gone))
+            mode = os.stat(auth.logout_file).st_mode
+            self.assertEqual(stat.S_IMODE(mode), 0o600)
+
+    def test_snapshot_trims(self):
+        """ A snapshot drops the logouts it reflects, not later ones
+        """
+        auth = SessionAuth()
+        first = auth.create_session(self.user.id)
+        second = auth.create_session(self.user.id)
+        auth.destroy_session(request(first))
+        offset = auth.logout_log_size()
+        auth.destroy_session(request(second))
+        auth.trim_logouts(offset)
+        self.assertEqual(auth.logged_out(), {second})
+        auth.save_sessions()
+        self.assertEqual(auth.logged_out(), set())
+
+        auth = self.restart(SessionAuth)
+        self.assertEqual(auth.user_id_by_session_id, {})
+
+
+class TestComposite(SessionTestCase):
+    """ AUTH_TYPE=session_exp_auth,session_auth
+    """
+
+    def test_separate_maps(self):
+        """ Each session type only reads the sessions it created
+        """
+        exp_auth, auth = SessionExpAuth(), SessionAuth()
+        self.assertIsNot(exp_auth.user_id_by_session_id,
+                         auth.user_id_by_session_id)
+        session_id = exp_auth.create_session(self.user.id)
+        self.assertIsNone(auth.user_id_for_session_id(session_id))
+
+    def test_removed_user(self):
+        """ The session of a removed user is refused by both types
+        """
+        composite = CompositeAuth([SessionExpAuth(), SessionAuth()])
+        session_id = composite.create_session(self.user.id)
+        self.assertEqual(composite.current_user(request(session_id)),
+                         self.user)
+        self.user.remove()
+        self.assertIsNone(composite.current_user(request(session_id)))
+        self.assertIsNone(composite.current_user(request(session_id)))
+
+
+if __name__ == "__main__":
+    unittest.main()
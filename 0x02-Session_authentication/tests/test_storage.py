@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+""" Tests of the storage engines: selection, and hydration of lazily
+loaded records
+"""
+import threading
+import unittest
+from unittest import mock
+
+from models import base
+from models.json_storage import JSONStorage
+from models.storage import SQLiteStorage
+from models.user import User
+from tests import StoreTestCase
+
+
+class TestStorage(StoreTestCase):
+    """ `storage()` returns the engine `DB_STORAGE` names
+    """
+
+    def engine(self, name: str):
+        """ Return the engine `storage()` builds for `DB_STORAGE=name`
+        """
+        with mock.patch.object(base, 'STORAGE', name), \
+                mock.patch.object(base, 'BACKEND', None):
+            return base.storage()
+
+    def test_engines(self):
+        """ json and sqlite are the two engines
+        """
+        self.assertIsInstance(self.engine('json'), JSONStorage)
+        self.assertIsInstance(self.engine('sqlite'), SQLiteStorage)
+
+    def test_unknown(self):
+        """ Any other name is refused instead of falling back to json
+        """
+        with self.assertRaises(ValueError):
+            self.engine('sqlite3')
+
+    def test_sqlite(self):
+        """ Base delegates to the sqlite engine like to the json one
+        """
+        engine = SQLiteStorage('test.sqlite3')
+        with mock.patch.object(base, 'BACKEND', engine):
+            user = User(email='bob@hbtn.io')
+            user.save()
+            self.assertEqual(User.count(), 1)
+            self.assertEqual(User.get(user.id), user)
+            self.assertEqual(User.search({'email': 'bob@hbtn.io'}), [user])
+            revision = User.revision()
+            user.remove()
+            self.assertEqual(User.count(), 0)
+            self.assertGreater(User.revision(), revision)
+
+
+class TestHydration(StoreTestCase):
+    """ Lazily loaded records are built without the writer lock
+    """
+
+    def test_no_writer_lock(self):
+        """ A reader hydrates while a writer holds the lock of the class
+        """
+        users = [User(email='user{}@hbtn.io'.format(i)) for i in range(3)]
+        User.bulk_save(users)
+        User.save_to_file()
+        User.load_from_file(lazy=True)
+        found = []
+        reader = threading.Thread(
+            target=lambda: found.extend(User.get(u.id) for u in users))
+        with base.storage().lock(User):
+            reader.start()
+            reader.join(5)
+            self.assertFalse(reader.is_alive())
+        self.assertEqual(found, users)
+        self.assertTrue(all(type(u) is User for u in found))
+
+    def test_writer_wins(self):
+        """ A record replaced while it was being built is not overwritten
+        """
+        user = User(email='bob@hbtn.io')
+        user.save()
+        User.save_to_file()
+        User.load_from_file(lazy=True)
+        engine = base.storage()
+        build = User.__init__
+
+        def replace(obj, *args, **kwargs):
+            build(obj, *args, **kwargs)
+            if not hasattr(replace, 'done'):
+                replace.done = True
+                user.first_name = 'Bob'
+                user.save()
+
+        with mock.patch.object(User, '__init__', replace):
+            found = engine.get(User, user.id)
+        self.assertIs(found, user)
+
+
+if __name__ == "__main__":
+    unittest.main()
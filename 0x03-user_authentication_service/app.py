@@ -1,16 +1,28 @@
 #!/usr/bin/env python3
 """Basic Flask app
+
+Importing this module builds nothing: `create_app()` opens the database
+and the hashing service. The processes of the hashing pool import it
+again as their `__main__` module.
 """
-from flask import Flask, jsonify, request, abort, Response, redirect
+from flask import (Blueprint, Flask, jsonify, request, abort, Response,
+                   redirect, current_app)
 
 from auth import Auth
+from db import POOL_CAPACITY
+from hashing import HashingBusy, hashing_service
+
 
+views = Blueprint("views", __name__)
 
-app = Flask(__name__)
-AUTH = Auth()
 
+def auth() -> Auth:
+    """Returns the Auth object of the current app.
+    """
+    return current_app.config["AUTH"]
 
-@app.route("/", methods=["GET"], strict_slashes=False)
+
+@views.route("/", methods=["GET"], strict_slashes=False)
 def index() -> Response:
     """GET /
     Return:
@@ -19,62 +31,62 @@ def index() -> Response:
     return jsonify({"message": "Bienvenue"})
 
 
-@app.route("/users", methods=["POST"], strict_slashes=False)
+@views.route("/users", methods=["POST"], strict_slashes=False)
 def users() -> Response:
     """Handle user registration."""
     try:
         email = request.form.get('email')
         password = request.form.get('password')
-        AUTH.register_user(email, password)
+        auth().register_user(email, password)
         return jsonify({"email": email, "message": "user created"}), 200
     except ValueError as e:
         return jsonify({"message": str(e)}), 400
 
 
-@app.route("/sessions", methods=["POST"], strict_slashes=False)
+@views.route("/sessions", methods=["POST"], strict_slashes=False)
 def login() -> str:
     """POST /sessions
     """
     email, password = request.form.get("email"), request.form.get("password")
-    if not AUTH.valid_login(email, password):
+    if not auth().valid_login(email, password):
         abort(401)
-    id = AUTH.create_session(email)
+    id = auth().create_session(email)
     res = jsonify({"email": email, "message": "logged in"})
     res.set_cookie("session_id", id)
     return res
 
 
-@app.route("/sessions", methods=["DELETE"], strict_slashes=False)
+@views.route("/sessions", methods=["DELETE"], strict_slashes=False)
 def logout() -> str:
     """DELETE /sessions
     """
     id = request.cookies.get("session_id")
-    user = AUTH.get_user_from_session_id(id)
+    user = auth().get_user_from_session_id(id)
     if user is None:
         abort(403)
-    AUTH.destroy_session(user.id)
+    auth().destroy_session(user.id)
     return redirect("/")
 
 
-@app.route("/profile", methods=["GET"], strict_slashes=False)
+@views.route("/profile", methods=["GET"], strict_slashes=False)
 def profile() -> str:
     """GET /profile
     """
     id = request.cookies.get("session_id")
-    user = AUTH.get_user_from_session_id(id)
+    user = auth().get_user_from_session_id(id)
     if user is None:
         abort(403)
     return jsonify({"email": user.email})
 
 
-@app.route("/reset_password", methods=["POST"], strict_slashes=False)
+@views.route("/reset_password", methods=["POST"], strict_slashes=False)
 def get_reset_password_token() -> str:
     """POST /reset_password
     """
     email = request.form.get("email")
     reset_token = None
     try:
-        reset_token = AUTH.get_reset_password_token(email)
+        reset_token = auth().get_reset_password_token(email)
     except ValueError:
         reset_token = None
     if reset_token is None:
@@ -82,7 +94,7 @@ def get_reset_password_token() -> str:
     return jsonify({"email": email, "reset_token": reset_token})
 
 
-@app.route("/reset_password", methods=["PUT"], strict_slashes=False)
+@views.route("/reset_password", methods=["PUT"], strict_slashes=False)
 def update_password() -> str:
     """PUT /reset_password
     """
@@ -91,7 +103,7 @@ def update_password() -> str:
     new_password = request.form.get("new_password")
     is_password_changed = False
     try:
-        AUTH.update_password(reset_token, new_password)
+        auth().update_password(reset_token, new_password)
         is_password_changed = True
     except ValueError:
         is_password_changed = False
@@ -100,5 +112,46 @@ def update_password() -> str:
     return jsonify({"email": email, "message": "Password updated"})
 
 
+@views.route("/metrics", methods=["GET"], strict_slashes=False)
+def metrics() -> Response:
+    """GET /metrics
+    Return:
+        - The counts and latency percentiles of the password hashing
+          service, by operation, and the rejected count.
+    """
+    return jsonify({"hashing": current_app.config["HASHING"].metrics()})
+
+
+@views.app_errorhandler(HashingBusy)
+def hashing_busy(error) -> Response:
+    """Too many logins or registrations in flight: fail fast.
+    """
+    res = jsonify({"message": "service unavailable"})
+    res.headers["Retry-After"] = "1"
+    return res, 503
+
+
+def create_app() -> Flask:
+    """Creates the app, its database and its hashing service.
+
+    Hashes in flight are capped at the database connections: each request
+    waiting on one may hold a connection again right after.
+    """
+    app = Flask(__name__)
+    app.config["AUTH"] = Auth()
+    app.config["HASHING"] = hashing_service(max_pending=POOL_CAPACITY)
+    app.register_blueprint(views)
+
+    @app.teardown_appcontext
+    def release_session(exception=None) -> None:
+        """Returns the database connection of the request to the pool.
+        """
+        app.config["AUTH"].release_session()
+
+    return app
+
+
 if __name__ == "__main__":
+    app = create_app()
+    app.config["HASHING"].start()
     app.run(host="0.0.0.0", port="5000")
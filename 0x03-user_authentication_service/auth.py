@@ -3,16 +3,16 @@
 """
 from typing import Union
 from uuid import uuid4
-import bcrypt
 from sqlalchemy.orm.exc import NoResultFound
 from db import DB
+from hashing import hashing_service
 from user import User
 
 
 def _hash_password(password: str) -> bytes:
-    """Hashes any password.
+    """Hashes any password, in the hashing service process pool.
     """
-    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt())
+    return hashing_service().hash_password(password)
 
 
 def _generate_uuid() -> str:
@@ -30,12 +30,19 @@ class Auth:
         """
         self._db = DB()
 
+    def release_session(self) -> None:
+        """Returns the database connection of the current thread to the
+        pool: at the end of each request, and before waiting on a hash.
+        """
+        self._db.remove_session()
+
     def register_user(self, email: str, password: str) -> User:
         """Registers a new user
         """
         try:
             self._db.find_user_by(email=email)
         except NoResultFound:
+            self.release_session()
             return self._db.add_user(email, _hash_password(password))
         raise ValueError("User {} already exists".format(email))
 
@@ -46,9 +53,11 @@ class Auth:
         try:
             user = self._db.find_user_by(email=email)
             if user is not None:
-                return bcrypt.checkpw(
-                    password.encode("utf-8"),
-                    user.hashed_password,
+                hashed_password = user.hashed_password
+                self.release_session()
+                return hashing_service().check_password(
+                    password,
+                    hashed_password,
                 )
         except NoResultFound:
             return False
@@ -111,9 +120,11 @@ class Auth:
             user = None
         if user is None:
             raise ValueError()
+        user_id = user.id
+        self.release_session()
         hash_new_password = _hash_password(password)
         self._db.update_user(
-            user.id,
+            user_id,
             hashed_password=hash_new_password,
             reset_token=None,
         )
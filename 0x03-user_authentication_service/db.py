@@ -3,13 +3,19 @@
 """
 from sqlalchemy import create_engine, tuple_
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import scoped_session, sessionmaker
 from sqlalchemy.orm.session import Session
 from sqlalchemy.orm.exc import NoResultFound
 from sqlalchemy.exc import InvalidRequestError
 
 from user import Base, User
 
+# connections of the engine: a request thread holds one from its first
+# query until `remove_session()`
+POOL_SIZE = 5
+MAX_OVERFLOW = 10
+POOL_CAPACITY = POOL_SIZE + MAX_OVERFLOW
+
 
 class DB:
     """DB class
@@ -18,19 +24,29 @@ class DB:
     def __init__(self) -> None:
         """Initialize a new DB instance
         """
-        self._engine = create_engine("sqlite:///a.db", echo=False)
+        self._engine = create_engine("sqlite:///a.db", echo=False,
+                                     pool_size=POOL_SIZE,
+                                     max_overflow=MAX_OVERFLOW)
         Base.metadata.drop_all(self._engine)
         Base.metadata.create_all(self._engine)
         self.__session = None
 
     @property
     def _session(self) -> Session:
-        """Memoized session object
+        """Memoized session object, one per thread: requests are served
+        concurrently while their passwords are hashed
         """
         if self.__session is None:
             DBSession = sessionmaker(bind=self._engine)
-            self.__session = DBSession()
-        return self.__session
+            self.__session = scoped_session(DBSession)
+        return self.__session()
+
+    def remove_session(self) -> None:
+        """Close the session of the current thread, returning its
+        connection to the pool; objects it loaded keep their attributes
+        """
+        if self.__session is not None:
+            self.__session.remove()
 
     def add_user(self, email: str, hashed_password: str) -> User:
         """Add a new user to the database
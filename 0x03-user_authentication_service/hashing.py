@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""Module offloading bcrypt hashing to a pool of processes.
+"""
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+import os
+import threading
+import time
+from typing import Callable
+
+import bcrypt
+
+
+class HashingBusy(Exception):
+    """Raised when the hashing service has too many pending operations.
+    """
+
+
+def _hash(password: bytes, rounds: int) -> bytes:
+    """Hashes a password with a new salt, in a pool process.
+    """
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+
+
+def _check(password: bytes, hashed_password: bytes) -> bool:
+    """Checks a password against its hash, in a pool process.
+    """
+    return bcrypt.checkpw(password, hashed_password)
+
+
+class HashingService:
+    """Runs bcrypt in a bounded pool of processes.
+
+    Settings, read from the environment:
+      - BCRYPT_WORKERS: pool processes (default: CPU count); 0 hashes
+        on the calling thread
+      - BCRYPT_ROUNDS: bcrypt cost factor (default 12)
+      - BCRYPT_MAX_PENDING: operations queued or running before new
+        ones fail fast with HashingBusy (default: 4 per process)
+
+    Pool processes come from a forkserver (spawn where there is none),
+    never from a fork of the threaded server process. The forkserver
+    preloads this module only; like with spawn, each process also imports
+    the `__main__` module, which must therefore not build anything at
+    import (see `create_app` in app.py). `start()` should run before
+    serving, so that the processes start at startup.
+
+    A pool whose process died (BrokenProcessPool) is replaced, and the
+    operation retried once on the new pool.
+    """
+
+    def __init__(self, workers: int = None, rounds: int = None,
+                 max_pending: int = None, samples: int = 1024) -> None:
+        """Initializes a new HashingService, its processes start with
+        `start()` or on first use.
+        """
+        if workers is None:
+            workers = int(os.getenv("BCRYPT_WORKERS", os.cpu_count() or 1))
+        if rounds is None:
+            rounds = int(os.getenv("BCRYPT_ROUNDS", "12"))
+        if max_pending is None:
+            max_pending = int(os.getenv("BCRYPT_MAX_PENDING",
+                                        str(4 * max(workers, 1))))
+        self.workers = workers
+        self.rounds = rounds
+        self.max_pending = max_pending
+        self.pending = 0
+        self._pool = self._new_pool() if workers > 0 else None
+        self._lock = threading.Lock()
+        self._latencies = {
+            "hash": deque(maxlen=samples),
+            "check": deque(maxlen=samples),
+        }
+        self._counts = {"hash": 0, "check": 0, "rejected": 0, "restarts": 0}
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        """Creates a pool of `workers` processes, started on first use.
+        """
+        if "forkserver" in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context("forkserver")
+            context.set_forkserver_preload(["hashing"])
+        else:
+            context = multiprocessing.get_context("spawn")
+        return ProcessPoolExecutor(max_workers=self.workers,
+                                   mp_context=context)
+
+    def _replace_pool(self, broken: ProcessPoolExecutor) -> None:
+        """Replaces a broken pool, unless another thread already did or
+        the service was shut down.
+        """
+        with self._lock:
+            if self._pool is not broken:
+                return
+            self._pool = self._new_pool()
+            self._counts["restarts"] += 1
+        broken.shutdown(wait=False)
+
+    def _submit(self, function: Callable, *args):
+        """Runs a function in the pool, or on the calling thread without
+        one, and waits for its result.
+        """
+        pool = self._pool
+        if pool is None:
+            return function(*args)
+        return pool.submit(function, *args).result()
+
+    def _run(self, operation: str, function: Callable, *args):
+        """Runs a function in the pool and waits for its result.
+        """
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self._counts["rejected"] += 1
+                raise HashingBusy("Hashing service busy")
+            self.pending += 1
+        start = time.perf_counter()
+        try:
+            pool = self._pool
+            try:
+                return self._submit(function, *args)
+            except BrokenProcessPool:
+                self._replace_pool(pool)
+                return self._submit(function, *args)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.pending -= 1
+                self._counts[operation] += 1
+                self._latencies[operation].append(elapsed)
+
+    def start(self) -> None:
+        """Starts every pool process and waits until they are up.
+        """
+        pool = self._pool
+        if pool is not None:
+            wait([pool.submit(os.getpid) for _ in range(self.workers)])
+
+    def hash_password(self, password: str) -> bytes:
+        """Hashes a password with a new salt.
+        """
+        return self._run("hash", _hash, password.encode("utf-8"),
+                         self.rounds)
+
+    def check_password(self, password: str, hashed_password: bytes) -> bool:
+        """Checks a password against its hash.
+        """
+        return self._run("check", _check, password.encode("utf-8"),
+                         hashed_password)
+
+    def metrics(self) -> dict:
+        """Returns the count and latency percentiles (over the last
+        samples, in seconds) of each operation, the rejected count and
+        the number of broken pools replaced.
+        """
+        with self._lock:
+            metrics = {
+                "pending": self.pending,
+                "rejected": self._counts["rejected"],
+                "restarts": self._counts["restarts"],
+            }
+            for operation, latencies in self._latencies.items():
+                samples = sorted(latencies)
+                metrics[operation] = {"count": self._counts[operation]}
+                for name, q in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99)):
+                    metrics[operation][name] = samples[
+                        min(len(samples) - 1, int(q * len(samples)))
+                    ] if samples else None
+        return metrics
+
+    def shutdown(self) -> None:
+        """Stops the pool processes.
+        """
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown()
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def hashing_service(max_pending: int = None) -> HashingService:
+    """Returns the shared HashingService, created on first use.
+
+    Args:
+        max_pending: upper bound of BCRYPT_MAX_PENDING, e.g. the number
+            of database connections, applied to the shared service.
+    """
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = HashingService()
+        if max_pending is not None:
+            _service.max_pending = min(_service.max_pending, max_pending)
+    return _service